@@ -241,6 +241,16 @@ cmd_get() {
   printf '%s\n' "$msg"
 }
 
+cmd_stream() {
+  local id="$1"
+  local line
+  curl "${EXTRA_CURL_ARGS[@]}" --fail-with-body -s -N "$BASE_URL/api/session/stream?id=${id}" | while IFS= read -r line; do
+    [ "${line#data: }" != "$line" ] || continue
+    jq -j '.msg' <<< "${line#data: }"
+  done
+  echo
+}
+
 cmd_stop() {
   local id="$1"
   cmd_get "$id" 1
@@ -320,6 +330,7 @@ Commands:
   compress [id]
   send [id]
   get [id]
+  stream [id]
   sendi [id]
   once
 
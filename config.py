@@ -6,9 +6,151 @@ class EngineConfig(NamedTuple):
     url: str
 
 
+class TokenizerConfig(NamedTuple):
+    # 后端： transformers（GPT2TokenizerFast）、 bpe（直接读取 gpt2 的 merges.txt）、 estimate（估算）
+    backend: str = "transformers"
+
+    # 模型或词表所在的目录，为空时使用 huggingface 缓存中的 gpt2
+    path: str = ""
+
+    # token 数量缓存的条目上限
+    cache_size: int = 65536
+
+    # 估算器参数：平均每个 token 的 ASCII 字符数，以及非 ASCII 文本平均每个字节的 token 数
+    # 默认值没有经过校准，取偏多的估计（英文约 4 个字符一个 token ，中文每个字约 1.8 个 token ），
+    # 避免超过 token 上限；需要准确的数量时使用 bpe 或 transformers
+    ascii_chars_per_token: float = 4.0
+    non_ascii_tokens_per_byte: float = 0.6
+
+
+class StorageConfig(NamedTuple):
+    # 数据库后端： directory（每个会话一个目录）、 sqlite（所有会话保存在数据库目录下的一个 SQLite 文件中）
+    backend: str = "directory"
+
+    # sqlite 后端的文件名
+    sqlite_file: str = "sessions.db"
+
+    # directory 后端的储存方式： snapshot（每次保存都重写 current.json）、 journal（追加变更记录，定期写检查点）
+    mode: str = "snapshot"
+
+    # journal 模式下，追加多少条记录后写一次检查点
+    checkpoint_interval: int = 64
+
+    # 持久化级别： none（只保证原子替换）、 interval（后台定期 fsync）、 strict（fsync 完成后才返回，并发写入合并 fsync）
+    durability: str = "strict"
+
+    # interval 级别下 fsync 的间隔秒数
+    flush_interval: float = 1.0
+
+
+class SessionConfig(NamedTuple):
+    # 会话空闲多少秒后休眠（停止线程并释放内存），为 0 时不休眠
+    hibernate_after: float = 3600.0
+
+    # 检查空闲会话的间隔秒数
+    hibernate_check_interval: float = 60.0
+
+    # 命令的执行方式： thread（每个会话一个主循环线程，每个命令一个工作线程）、 pool（所有会话共享有界的线程池）
+    runtime: str = "thread"
+
+    # pool 方式下执行命令的线程池大小，轮询之间的等待不占用线程，只限制同时进行的 HTTP 请求等阻塞调用
+    workers: int = 32
+
+
+class PollConfig(NamedTuple):
+    # 等待回复时的轮询策略： fixed（固定间隔）、 adaptive（根据回复增长的速度与是否有人在看调整间隔）
+    policy: str = "adaptive"
+
+    # 有人在等待的回复的最短轮询间隔秒数
+    interactive_interval: float = 0.1
+
+    # 后台的压缩、继承等回复的最短轮询间隔秒数
+    background_interval: float = 1.0
+
+    # 回复没有增长时间隔最多退避到最短间隔的多少倍
+    backoff: float = 10.0
+
+    # adaptive 策略下希望每次轮询拿到的新字符数
+    chunk: int = 8
+
+
+class ScheduleConfig(NamedTuple):
+    # 可用帐号列表的缓存秒数，帐号出错时会提前失效
+    accounts_ttl: float = 10.0
+
+    # 新会话选择帐号的方式： least（综合后端负载与本地统计的正在进行的请求、错误、延迟，选负载最低的）、
+    # two_choices（随机选两个帐号，取其中负载较低的）
+    placement: str = "least"
+
+    # 每个帐号每秒最多发送的消息数，为 0 时不限流
+    account_rate: float = 0.0
+
+    # 每个帐号最多连续发送的消息数
+    account_burst: int = 3
+
+    # 每个 openai 的 key 每秒最多发送的请求数，为 0 时不限流
+    openai_rate: float = 0.0
+
+    # 每个 openai 的 key 最多连续发送的请求数
+    openai_burst: int = 3
+
+    # 后端或帐号连续失败多少次后熔断
+    breaker_threshold: int = 5
+
+    # 熔断后等待多少秒再试探
+    breaker_cooldown: float = 30.0
+
+    # 试探时同时允许通过的请求数
+    breaker_probes: int = 1
+
+    # 一次性消息是否使用对冲模式：第一个帐号迟迟没有开始回复时向第二个帐号发送同样的消息，先完成的作为结果
+    hedge: bool = False
+
+    # 按最近从发送到开始回复的耗时的哪个分位数决定何时对冲
+    hedge_percentile: float = 0.9
+
+    # 样本不足时等待多少秒后对冲
+    hedge_delay: float = 5.0
+
+    # 一次性消息的回复缓存多少秒，相同的消息直接返回缓存的回复，为 0 时只合并同时进行的相同消息
+    away_cache_ttl: float = 0.0
+
+    # 最多缓存多少条一次性消息的回复
+    away_cache_size: int = 256
+
+    # 第一条需要分类的消息到达后等待多少秒，收集其他会话的消息合并为一次分类，为 0 时每个会话单独分类
+    classify_batch_window: float = 0.0
+
+    # 最多合并多少条消息
+    classify_batch_size: int = 8
+
+
+class ClassifyConfig(NamedTuple):
+    # 分类结果缓存在数据库目录下的文件名
+    cache_file: str = ".classify-cache.db"
+
+    # 分类结果缓存多少秒，为 0 时不缓存
+    cache_ttl: float = 604800.0
+
+    # 最多缓存多少条分类结果
+    cache_size: int = 100000
+
+    # 本地分类模型在数据库目录下的文件名，由 train_classifier.py 生成
+    model_file: str = ".classify-model.json"
+
+    # 是否使用本地分类模型，模型有把握的消息不再发给 ChatGPT 分类
+    local: bool = True
+
+
 class Config(NamedTuple):
     engines: OrderedDict[str, EngineConfig]
     openai: dict
+    tokenizer: TokenizerConfig = TokenizerConfig()
+    storage: StorageConfig = StorageConfig()
+    session: SessionConfig = SessionConfig()
+    poll: PollConfig = PollConfig()
+    schedule: ScheduleConfig = ScheduleConfig()
+    classify: ClassifyConfig = ClassifyConfig()
 
     @staticmethod
     def from_file(config_path: str):
@@ -17,4 +159,16 @@ class Config(NamedTuple):
         config = Config(**json.loads(config_str))
         for engine in config.engines:
             config.engines[engine] = EngineConfig(**dict(config.engines[engine]))
+        if isinstance(config.tokenizer, dict):
+            config = config._replace(tokenizer=TokenizerConfig(**config.tokenizer))
+        if isinstance(config.storage, dict):
+            config = config._replace(storage=StorageConfig(**config.storage))
+        if isinstance(config.session, dict):
+            config = config._replace(session=SessionConfig(**config.session))
+        if isinstance(config.poll, dict):
+            config = config._replace(poll=PollConfig(**config.poll))
+        if isinstance(config.schedule, dict):
+            config = config._replace(schedule=ScheduleConfig(**config.schedule))
+        if isinstance(config.classify, dict):
+            config = config._replace(classify=ClassifyConfig(**config.classify))
         return config
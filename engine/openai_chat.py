@@ -1,7 +1,7 @@
 import random
 import time
 from dataclasses import dataclass, asdict
-from typing import List
+from typing import Callable, List
 
 import openai
 from openai.error import AuthenticationError, RateLimitError
@@ -20,9 +20,10 @@ class Message:
 
 
 class OpenAIChatCompletion:
-    def __init__(self, keys: List[str]):
+    def __init__(self, keys: List[str], acquire: Callable[[int], None] | None = None):
         self.__index = 0
         self.__keys = keys
+        self.__acquire = acquire  # 使用第几个 key 发送前调用，用于限流
 
     def send(self, messages: List[Message], model="gpt-3.5-turbo") -> str:
         if not self.available():
@@ -35,6 +36,8 @@ class OpenAIChatCompletion:
         while self.available():
             openai.api_key = self.__keys[self.__index]
             while True:
+                if self.__acquire is not None:
+                    self.__acquire(self.__index)
                 try:
                     completion = openai.ChatCompletion.create(model=model, messages=messages_)
                     return completion.choices[0].message.content
@@ -27,6 +27,13 @@ class GetMessageResponse:
     mid: str
     msg: str
     end: bool
+    offset: int = 0  # msg 在完整回复中的起始位置
+
+    # 只保留 offset 之后的文本，offset 超出范围时返回完整的文本
+    def after(self, offset: int):
+        if offset <= 0 or offset > len(self.msg):
+            return self
+        return GetMessageResponse(self.id, self.mid, self.msg[offset:], self.end, self.offset + offset)
 
     @staticmethod
     def from_body(body: bytes):
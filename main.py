@@ -10,27 +10,46 @@ def run(host: str, port: int, text: str, config_path: str, database: str):
     import os
     import openai
 
+    import tokenizer
     from config import Config
     from engine.openai_chat import OpenAIChatCompletion
     from engine.rev_chatgpt_web import RevChatGPTWeb
     from schedule import Scheduler
+    from schedule.breaker import breakers
+    from schedule.limit import Limiters, limiters
+    from schedule.poll import poller
     from server import app
     from server.common import globalObject
+    from session.classifier import local_classifier
+    from session.classify import classify_cache
+    from session.flush import flusher
     from session.manager import SessionManager
     os.makedirs(database, exist_ok=True)
 
     config = Config.from_file(config_path)
+    tokenizer.initialize(config.tokenizer)
+    flusher.configure(config.storage.durability, config.storage.flush_interval)
+    poller.configure(config.poll.policy, config.poll.interactive_interval, config.poll.background_interval,
+                     config.poll.backoff, config.poll.chunk)
+    limiters.configure(Limiters.ACCOUNT, config.schedule.account_rate, config.schedule.account_burst)
+    limiters.configure(Limiters.OPENAI, config.schedule.openai_rate, config.schedule.openai_burst)
+    breakers.configure(config.schedule.breaker_threshold, config.schedule.breaker_cooldown,
+                       config.schedule.breaker_probes)
+    classify_cache.configure(os.path.join(database, config.classify.cache_file), config.classify.cache_ttl,
+                             config.classify.cache_size)
+    local_classifier.configure(os.path.join(database, config.classify.model_file), config.classify.local)
     openai.proxy = config.openai["proxy"]
     engines = {
         RevChatGPTWeb.__name__: RevChatGPTWeb(config.engines[RevChatGPTWeb.__name__].url),
-        OpenAIChatCompletion.__name__: OpenAIChatCompletion(config.openai["keys"]),
+        OpenAIChatCompletion.__name__: OpenAIChatCompletion(
+            config.openai["keys"], lambda index: limiters.acquire(Limiters.OPENAI, str(index))),
     }
-    scheduler = Scheduler(engines)
+    scheduler = Scheduler(engines, config.schedule)
 
     globalObject.text = text
     globalObject.database = database
     globalObject.scheduler = scheduler
-    globalObject.session_manager = SessionManager(text, database, scheduler)
+    globalObject.session_manager = SessionManager(text, database, scheduler, config.storage, config.session)
 
     from waitress import serve
     serve(app, host=host, port=port, threads=256)
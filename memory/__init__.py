@@ -57,8 +57,9 @@ class Message:
     mid: str
     sender: int
     content: str
-    tokens: int
+    tokens: int  # 原始消息（remark["raw"]，没有则为 content）的 token 数
     remark: dict
+    content_tokens: int = -1  # content 的 token 数，-1 表示尚未计算
 
     AI = 0
     USER = 1
@@ -67,6 +68,17 @@ class Message:
         USER: engine.openai_chat.Message.USER,
     }
 
+    def set_content(self, content: str, content_tokens: int = -1):
+        if content == self.content:
+            return
+        self.content = content
+        self.content_tokens = content_tokens
+
+    def count_content_tokens(self) -> int:
+        if self.content_tokens < 0:
+            self.content_tokens = token_len(self.content)
+        return self.content_tokens
+
     def to_openai_chat(self) -> engine.openai_chat.Message:
         return engine.openai_chat.Message(
             Message.__openai_chat_role[self.sender],
@@ -99,6 +111,7 @@ class CurrentConversation:
     @staticmethod
     def from_dict(d: dict):
         new_d = copy.deepcopy(d)
+        new_d.pop("guide_tokens", None)  # 旧版本保存的字段，已不再使用
         new_d["pointer"] = EnginePointer(**new_d["pointer"])
         messages = []
         for message in new_d["messages"]:
@@ -112,4 +125,4 @@ class CurrentConversation:
 
     def append_message(self, message: Message):
         self.messages.append(message)
-        self.tokens += token_len(message.content) + 1
+        self.tokens += message.count_content_tokens() + 1
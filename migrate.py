@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- encoding:utf-8 -*-
+
+import argparse
+import sqlite3
+import sys
+
+
+# 把目录储存的会话导入 sqlite 后端，已经存在的会话跳过
+def migrate(config_path: str, database: str) -> int:
+    import os
+
+    from config import Config
+    from session.database import DirectoryDatabase
+    from session.sqlite import SQLiteDatabase
+
+    config = Config.from_file(config_path)
+    source = DirectoryDatabase(database, config.storage._replace(backend="directory"))
+    target = SQLiteDatabase(os.path.join(database, config.storage.sqlite_file), config.storage)
+
+    migrated = 0
+    for index in source.list():
+        id_ = index["id"]
+        storage = source.storage(index)
+        try:
+            # 先读出全部源数据，再在一个事务中写入会话、备注和归档，失败时整个会话回滚，下次运行会重新导入
+            current = storage.current if storage.load(readonly=True) else None  # 不修改源数据
+            remark = storage.load_remark()
+            archives = []
+            archive_path = os.path.join(database, id_, "archive")
+            if os.path.isdir(archive_path):
+                for name in sorted(os.listdir(archive_path)):
+                    with open(os.path.join(archive_path, name), "r") as f:
+                        archives.append((name, f.read()))
+            target.create(index, current, remark, archives)
+        except FileExistsError:
+            print(f"skip {id_}: already exists")
+            continue
+        except (OSError, ValueError, KeyError, TypeError, sqlite3.Error) as e:
+            print(f"skip {id_}: {e}")
+            continue
+        migrated += 1
+        print(f"migrated {id_}")
+
+    target.close()
+    print(f"{migrated} sessions migrated")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="migrate chatgpt session database to sqlite")
+    parser.add_argument('--config', '-c', type=str, help='config.json', default="config.json")
+    parser.add_argument('--database', '-d', type=str, help='database path', default='./database')
+    args = parser.parse_args()
+
+    return migrate(args.config, args.database)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
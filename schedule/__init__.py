@@ -1,7 +1,11 @@
 import http
+import itertools
 import json
+import queue
 import random
+import threading
 import time
+from concurrent.futures import Future
 from dataclasses import dataclass
 from typing import Tuple, Callable, List
 
@@ -11,9 +15,17 @@ import requests
 import engine
 import error
 from engine.openai_chat import OpenAIChatCompletion
+from config import ScheduleConfig
 from engine.rev_chatgpt_web import RevChatGPTWeb, AccountInfo, SendResponse, GetMessageResponse
 from memory import CurrentConversation, Message, EnginePointer
-from tokenizer import token_len
+from schedule.accounts import AccountRegistry
+from schedule.batch import ClassifyBatcher
+from schedule.breaker import Breakers, CircuitBreaker, breakers
+from schedule.flight import SingleFlight
+from schedule.hedge import HedgeStats
+from schedule.limit import Limiters, limiters
+from schedule.poll import poller
+from tokenizer import token_len, exceeds
 
 
 def account_load(account: AccountInfo) -> int:
@@ -39,10 +51,38 @@ sleep_strategies = {
 }
 
 
+# 网页版 ChatGPT 后端的熔断器，后端故障时只有少量的试探请求，其他请求等待冷却，避免所有线程一起重试
+def rev_chatgpt_web_breaker() -> CircuitBreaker:
+    return breakers.get(Breakers.ENGINE, RevChatGPTWeb.__name__)
+
+
+# 经过后端熔断器发送一个请求，熔断时不等待冷却，直接抛出 ServerIsBusy 由调用者稍后重试
+# 请求异常和 5xx 记为失败，其他响应记为成功，其他异常退出时只释放占用的试探名额
+def rev_chatgpt_web_call(breaker: CircuitBreaker, fn: Callable[[], requests.Response]) -> requests.Response:
+    if not breaker.acquire():
+        raise error.ServerIsBusy(f"{RevChatGPTWeb.__name__} is unavailable")
+    ok = None
+    try:
+        resp = fn()
+        ok = resp.status_code // 100 != 5
+        return resp
+    except requests.RequestException:
+        ok = False
+        raise
+    finally:
+        if ok is None:
+            breaker.release()
+        elif ok:
+            breaker.success()
+        else:
+            breaker.failure()
+
+
 def call_until_success(fn: Callable[[], requests.Response]) -> bytes:
+    breaker = rev_chatgpt_web_breaker()
     while True:
         try:
-            resp = fn()
+            resp = rev_chatgpt_web_call(breaker, fn)
         except requests.RequestException as e:
             print(f"请求错误： {e}")
             print(f"等待 10 秒后重试 ...")
@@ -66,12 +106,19 @@ def call_until_success(fn: Callable[[], requests.Response]) -> bytes:
         return resp.content
 
 
-def rev_chatgpt_web_history(api: RevChatGPTWeb, account: str, id_: str) -> dict:
+# 帐号出错时让帐号列表的缓存失效
+def invalidate_account(registry: AccountRegistry | None, account: str):
+    if registry is not None:
+        registry.invalidate(account)
+
+
+def rev_chatgpt_web_history(api: RevChatGPTWeb, account: str, id_: str, registry: AccountRegistry | None = None) -> dict:
     assert len(id_) != 0
+    breaker = rev_chatgpt_web_breaker()
     wait_ms = 0
     while True:
         try:
-            resp = api.history(account, id_)
+            resp = rev_chatgpt_web_call(breaker, lambda: api.history(account, id_))
         except requests.RequestException:
             time.sleep(10)
             continue
@@ -80,6 +127,7 @@ def rev_chatgpt_web_history(api: RevChatGPTWeb, account: str, id_: str) -> dict:
         sleep_strategy = sleep_strategies.get(resp.status_code)
         if sleep_strategy is None:
             if resp.status_code == http.HTTPStatus.UNAUTHORIZED:
+                invalidate_account(registry, account)
                 raise error.Unauthorized(resp.content)
             if resp.status_code == http.HTTPStatus.TOO_MANY_REQUESTS:
                 if b'by proxy' in resp.content or b'rate limited' in resp.content:
@@ -88,6 +136,7 @@ def rev_chatgpt_web_history(api: RevChatGPTWeb, account: str, id_: str) -> dict:
                     print(f"等待 {wait_s} 秒后重试 ...")
                     time.sleep(wait_s)
                     continue
+                invalidate_account(registry, account)
                 raise error.ServerIsBusy(resp.content)
             raise error.InternalError(resp.status_code, resp.content)
         if wait_ms == 0:
@@ -101,26 +150,58 @@ def rev_chatgpt_web_history(api: RevChatGPTWeb, account: str, id_: str) -> dict:
         time.sleep(float(wait_ms) / 1000)
 
 
+# 根据发送消息的响应更新后端与帐号的熔断器
+def record_send(engine_breaker: CircuitBreaker, account_breaker: CircuitBreaker, resp: requests.Response, msg: str):
+    if resp.status_code // 100 == 5 and not exceeds(msg, 1536):
+        engine_breaker.failure()
+    elif resp.status_code // 100 == 5:
+        engine_breaker.release()
+    else:
+        engine_breaker.success()
+    if resp.status_code == http.HTTPStatus.OK:
+        account_breaker.success()
+    elif resp.status_code == http.HTTPStatus.UNAUTHORIZED or (
+            resp.status_code == http.HTTPStatus.TOO_MANY_REQUESTS and
+            b'by proxy' not in resp.content and b'rate limited' not in resp.content):
+        account_breaker.failure()
+    else:
+        account_breaker.release()
+
+
 def rev_chatgpt_web_send(
         api: RevChatGPTWeb, account: str, msg: str, id_: str = '', mid: str = '',
-        no_wait: bool = False) -> str:
+        no_wait: bool = False, registry: AccountRegistry | None = None, reservation: str = "") -> str:
+    engine_breaker = rev_chatgpt_web_breaker()
+    account_breaker = breakers.get(Breakers.ACCOUNT, account)
     retry_count = 0
     wait_ms = 0
     while True:
+        # 帐号熔断时不在这里等待冷却，由调用者换一个帐号
+        if not account_breaker.acquire():
+            raise error.ServerIsBusy(f"account {account} is unavailable")
+        limiters.acquire(Limiters.ACCOUNT, account)
+        engine_breaker.wait()  # 紧挨着发送才占用后端的试探名额，避免半开时其他请求在等待帐号时被挡住
         try:
             print(f"send: {account} (id: {id_}, mid: {mid})")
+            start = time.time()
             resp = api.send(account, msg, id_, mid)
             print(f"resp {resp.status_code}: {account} (id: {id_}, mid: {mid})")
             if resp.status_code != http.HTTPStatus.OK:
                 print(f"resp {resp.status_code}: {resp.content.decode()}")
         except requests.RequestException:
+            engine_breaker.failure()
+            account_breaker.release()
             time.sleep(10)
             continue
+        record_send(engine_breaker, account_breaker, resp, msg)
         if resp.status_code == http.HTTPStatus.OK:
             r = SendResponse(**json.loads(resp.content))
+            if registry is not None:
+                registry.sent(account, r.mid, time.time() - start, reservation)
             return r.mid
         elif resp.status_code == http.HTTPStatus.CONFLICT:
             # 该帐号有负载，增加它的计数
+            invalidate_account(registry, account)
             call_until_success(lambda: api.counter(account, 30))
         elif resp.status_code == http.HTTPStatus.TOO_MANY_REQUESTS:
             if b'by proxy' in resp.content or b'rate limited' in resp.content:
@@ -130,16 +211,18 @@ def rev_chatgpt_web_send(
                 time.sleep(wait_s)
                 continue
             # 该帐号有负载，增加它的计数
+            invalidate_account(registry, account)
             call_until_success(lambda: api.counter(account, 150))
         elif resp.status_code == http.HTTPStatus.NOT_FOUND:
             # 该帐号会话被恶意删除，增加它的计数
+            invalidate_account(registry, account)
             call_until_success(lambda: api.counter(account, 60))
             raise error.ServerIsBusy(resp.content)
         elif resp.status_code == http.HTTPStatus.INTERNAL_SERVER_ERROR:
-            if token_len(msg) > 1536:
+            if exceeds(msg, 1536):
                 raise error.TooLarge(resp.content)
         elif resp.status_code == http.HTTPStatus.NOT_ACCEPTABLE:
-            if token_len(msg) > 1536:
+            if exceeds(msg, 1536):
                 raise error.TooLarge(resp.content)
             # Something went wrong
             # 需要重新加载会话
@@ -153,7 +236,7 @@ def rev_chatgpt_web_send(
                 print(f"准备重新发送")
                 time.sleep(1)
                 continue
-            history = rev_chatgpt_web_history(api, account, id_)
+            history = rev_chatgpt_web_history(api, account, id_, registry)
             current_node = history["mapping"][history["current_node"]]
             if current_node["message"]["author"]["role"] == "user":
                 mid = current_node["parent"]
@@ -167,6 +250,7 @@ def rev_chatgpt_web_send(
         sleep_strategy = sleep_strategies.get(resp.status_code)
         if sleep_strategy is None:
             if resp.status_code == http.HTTPStatus.UNAUTHORIZED:
+                invalidate_account(registry, account)
                 raise error.Unauthorized(resp.content)
             if resp.status_code == http.HTTPStatus.TOO_MANY_REQUESTS:
                 raise error.ServerIsBusy(resp.content)
@@ -194,60 +278,103 @@ def openai_chat_send(api: OpenAIChatCompletion, messages: List[engine.openai_cha
 
 
 class Scheduler:
-    def __init__(self, engines: dict):
+    def __init__(self, engines: dict, config: ScheduleConfig = ScheduleConfig()):
         self.__engines: dict = engines
+        self.__config: ScheduleConfig = config
+        self.__hedge: HedgeStats = HedgeStats(config.hedge_percentile, config.hedge_delay)
+        self.__flight: SingleFlight = SingleFlight(config.away_cache_ttl, config.away_cache_size)
+        self.__away_ids = itertools.count()  # 一次性消息的放置使用的 owner
+        self.__batcher: ClassifyBatcher = ClassifyBatcher(
+            lambda prompt, level: self.send_away(prompt, level, "classify"),
+            config.classify_batch_window, config.classify_batch_size)
+        self.__accounts: AccountRegistry = AccountRegistry(self.__fetch_accounts, config.accounts_ttl, config.placement)
+
+    def stats(self) -> dict:
+        return {
+            "accounts": self.__accounts.stats(),
+            "limits": limiters.stats(),
+            "breakers": breakers.stats(),
+            "hedge": self.__hedge.stats(),
+            "away": self.__flight.stats(),
+            "classify_batch": self.__batcher.stats(),
+        }
+
+    def hedged(self) -> bool:
+        return self.__config.hedge
 
     # 评估一个会话的请求应该被调度到哪个引擎的哪个账户上，返回引擎id和账户id
-    def evaluate(self, pointer: EnginePointer) -> Tuple[str, str]:
-        api: RevChatGPTWeb = self.__engines[RevChatGPTWeb.__name__]
-        accounts_dict = json.loads(call_until_success(lambda: api.accounts(pointer.level)))
-        accounts: List[AccountInfo] = []
-        accounts_found = False
-        for account_dict in accounts_dict:
-            account = AccountInfo(**account_dict)
-            if account.id == pointer.account:
-                accounts_found = True
-            accounts.append(account)
+    # exclude 中的帐号不参与新会话的选择，除非没有其他帐号
+    # 新放置的帐号以 pointer.title 为 owner 预约，到使用它的发送成功为止；重新评估时取消之前没有用上的预约
+    def evaluate(self, pointer: EnginePointer, exclude: Tuple[str, ...] = ()) -> Tuple[str, str]:
+        self.__accounts.release(pointer.title)
+
+        # 后端熔断时改用 openai 的接口
+        openai_api: OpenAIChatCompletion = self.__engines[OpenAIChatCompletion.__name__]
+        if not rev_chatgpt_web_breaker().available() and openai_api.available():
+            return OpenAIChatCompletion.__name__, ""
+
+        accounts: List[AccountInfo] = list(self.__accounts.accounts(pointer.level))
+        accounts_found = any(account.id == pointer.account for account in accounts)
 
         # 如果不是新创建会话，则不改变账户
         if pointer.status != EnginePointer.UNINITIALIZED and pointer.engine == RevChatGPTWeb.__name__ and accounts_found:
             assert len(pointer.account) != 0
             return pointer.engine, pointer.account
 
-        if len(accounts_dict) > 0:
+        if len(accounts) > 0:
             if pointer.status == EnginePointer.UNINITIALIZED or pointer.engine != RevChatGPTWeb.__name__:
-                # 如果是新创建的会话，则选择负载最低的账户
-                accounts.sort(key=account_load)
-                return RevChatGPTWeb.__name__, accounts[0].id
+                # 如果是新创建的会话，则选择负载最低的账户，熔断中的帐号不参与
+                available = [account for account in accounts if breakers.get(Breakers.ACCOUNT, account.id).available()]
+                candidates = [account for account in available if account.id not in exclude]
+                return RevChatGPTWeb.__name__, self.__accounts.place(
+                    candidates or available or accounts, account_load, pointer.title)
 
         return OpenAIChatCompletion.__name__, ""
 
-    # 发送一次性的消息
-    def send_away(self, msg: str, level: int) -> str:
-        t_len = token_len(msg)
-        if t_len > 1536:
-            raise error.TooLarge("message too long: " + str(t_len) + " > 1536")
+    def __fetch_accounts(self, level: int) -> List[AccountInfo]:
+        api: RevChatGPTWeb = self.__engines[RevChatGPTWeb.__name__]
+        accounts_dict = json.loads(call_until_success(lambda: api.accounts(level)))
+        return [AccountInfo(**account_dict) for account_dict in accounts_dict]
+
+    # 发送一次性的消息， loop 为等待回复的循环名称，决定轮询的间隔
+    # 同时进行的相同消息只发送一次，共享同一个回复
+    def send_away(self, msg: str, level: int, loop: str = "away") -> str:
+        future, leader = self.__join_away(msg, level)
+        if leader:
+            self.__lead_away(msg, level, loop)
+        return future.result()
+
+    # 不阻塞的 send_away ：在后台线程中发送，返回回复的 Future ，调用者轮询 done() 而不占用线程等待
+    def send_away_future(self, msg: str, level: int, loop: str = "away") -> Future:
+        future, leader = self.__join_away(msg, level)
+        if leader:
+            threading.Thread(target=self.__lead_away, args=(msg, level, loop), daemon=True).start()
+        return future
+
+    def __join_away(self, msg: str, level: int) -> Tuple[Future, bool]:
+        if exceeds(msg, 1536):
+            raise error.TooLarge("message too long: " + str(token_len(msg)) + " > 1536")
+        return self.__flight.join((msg, level))
+
+    # 真正发送消息，结果和异常都交给 Future
+    def __lead_away(self, msg: str, level: int, loop: str):
+        key = (msg, level)
+        try:
+            reply = self.__send_away(msg, level, loop)
+        except BaseException as err:
+            self.__flight.fail(key, err)
+            return
+        self.__flight.done(key, reply)
+
+    def __send_away(self, msg: str, level: int, loop: str) -> str:
+        if self.__config.hedge:
+            return self.__send_away_hedged(msg, level, loop)
         while True:
-            pointer = EnginePointer(level=level)
+            pointer = self.__away_pointer(level)
             engine_, account = self.evaluate(pointer)
             try:
                 if engine_ == RevChatGPTWeb.__name__:
-                    api: RevChatGPTWeb = self.__engines[RevChatGPTWeb.__name__]
-
-                    # 发送消息给 ChatGPT
-                    mid = rev_chatgpt_web_send(api, account, msg, no_wait=True)
-
-                    # 循环等到 ChatGPT 回复完成
-                    while True:
-                        new_message = GetMessageResponse.from_body(
-                            call_until_success(lambda: api.get(mid, False)))
-                        if new_message.end:
-                            break
-                        time.sleep(0.1)
-
-                    # 删除会话
-                    call_until_success(lambda: api.delete(account, new_message.id))
-                    return new_message.msg
+                    return self.__away(account, pointer.title, msg, loop)
                 elif engine_ == OpenAIChatCompletion.__name__:
                     api: OpenAIChatCompletion = self.__engines[OpenAIChatCompletion.__name__]
                     return openai_chat_send(api, [engine.openai_chat.Message(
@@ -262,6 +389,118 @@ class Scheduler:
                 time.sleep(1)
                 pass
 
+    def __away_pointer(self, level: int) -> EnginePointer:
+        return EnginePointer(level=level, title=f"away:{next(self.__away_ids)}")
+
+    # 在帐号上发送一次性的消息并等待回复完成后删除会话， reservation 为放置该帐号时的 owner
+    # started 在回复开始生成时被设置； cancel 被设置时停止生成，删除会话后返回 None
+    def __away(self, account: str, reservation: str, msg: str, loop: str,
+               started: threading.Event | None = None, cancel: threading.Event | None = None) -> str | None:
+        api: RevChatGPTWeb = self.__engines[RevChatGPTWeb.__name__]
+
+        # 发送消息给 ChatGPT
+        begin = time.time()
+        try:
+            mid = rev_chatgpt_web_send(
+                api, account, msg, no_wait=True, registry=self.__accounts, reservation=reservation)
+        except Exception:
+            self.__accounts.release(reservation)
+            raise
+
+        # 循环等到 ChatGPT 回复完成
+        poll = poller.loop(loop)
+        streaming = False
+        while True:
+            stop = cancel is not None and cancel.is_set()
+            new_message = GetMessageResponse.from_body(
+                call_until_success(lambda: api.get(mid, stop)))
+            if not streaming and not stop and (len(new_message.msg) != 0 or new_message.end):
+                streaming = True
+                self.__hedge.record(time.time() - begin)
+                if started is not None:
+                    started.set()
+            interval = poll.next(len(new_message.msg))
+            if new_message.end or stop:
+                self.__accounts.finished(mid)
+                break
+            time.sleep(interval)
+
+        # 删除会话
+        call_until_success(lambda: api.delete(account, new_message.id))
+        if stop:
+            return None
+        return new_message.msg
+
+    # 对冲模式：第一个帐号超过统计的耗时分位数还没有开始生成回复时，向另一个帐号发送同样的消息，
+    # 先完成的作为结果，另一个停止生成并删除会话
+    def __send_away_hedged(self, msg: str, level: int, loop: str) -> str:
+        while True:
+            pointer = self.__away_pointer(level)
+            results: queue.Queue = queue.Queue()
+            cancel = threading.Event()
+            accounts: List[str] = []
+
+            def attempt(account_: str, reservation: str, started_: threading.Event | None):
+                try:
+                    results.put((account_, self.__away(account_, reservation, msg, loop, started_, cancel), None))
+                except Exception as err_:
+                    results.put((account_, None, err_))
+
+            engine_, account = self.evaluate(pointer)
+            if engine_ == OpenAIChatCompletion.__name__:
+                api: OpenAIChatCompletion = self.__engines[OpenAIChatCompletion.__name__]
+                return openai_chat_send(api, [engine.openai_chat.Message(
+                    role=Message.USER,
+                    content=msg,
+                )])
+            started = threading.Event()
+            accounts.append(account)
+            threading.Thread(target=attempt, args=(account, pointer.title, started), daemon=True).start()
+            delay = self.__hedge.deadline()
+            deadline = time.time() + delay
+            running = 1
+            hedged = False
+            error_ = None
+            while running != 0:
+                timeout = None
+                if not hedged and not started.is_set():
+                    timeout = max(deadline - time.time(), 0)
+                try:
+                    account, reply, err = results.get(timeout=timeout)
+                except queue.Empty:
+                    hedged = True
+                    if started.is_set():
+                        continue
+                    hedge_pointer = self.__away_pointer(level)
+                    engine_, account = self.evaluate(hedge_pointer, tuple(accounts))
+                    if engine_ != RevChatGPTWeb.__name__ or account in accounts:
+                        self.__accounts.release(hedge_pointer.title)
+                        continue  # 没有其他可用的帐号
+                    print(f"send_away 对冲： {accounts[0]} 超过 {delay:.2f} 秒还没有开始回复，发送给 {account}")
+                    accounts.append(account)
+                    threading.Thread(target=attempt, args=(account, hedge_pointer.title, None), daemon=True).start()
+                    running += 1
+                    continue
+                running -= 1
+                if err is None:
+                    cancel.set()  # 停止其他帐号的生成
+                    self.__hedge.count(len(accounts) > 1, account != accounts[0])
+                    return reply
+                error_ = err
+            if not isinstance(error_, (error.Unauthorized, error.ServerIsBusy)):
+                raise error_
+            print(f"send_away 错误： {error_}")
+            print(f"等待 1 秒后重试 ...")
+            time.sleep(1)
+
+    # 与其他会话的消息合并分类， build 与 parse 为规则中合并分类的函数
+    # 返回的 Future 的结果为分类结果，没有得到结果时为 None ；没有开启合并分类时返回 None
+    def classify(self, key: str, level: int, message: Message, build: Callable[[List[Message]], str],
+                 parse: Callable[[str, int], List[str]]) -> Future | None:
+        if not self.__batcher.enabled():
+            return None
+        return self.__batcher.submit(key, level, message, build, parse)
+
     def send(self, current: CurrentConversation) -> str:
         assert current.pointer.engine in self.__engines
 
@@ -270,8 +509,13 @@ class Scheduler:
             api: RevChatGPTWeb = self.__engines[RevChatGPTWeb.__name__]
 
             if current.pointer.status == EnginePointer.UNINITIALIZED or current.pointer.status == EnginePointer.BREAK:
-                # 第一次发送消息，需要新建会话，发送 guide
-                mid = rev_chatgpt_web_send(api, current.pointer.account, current.guide)
+                # 第一次发送消息，需要新建会话，发送 guide ，使用放置时的预约
+                try:
+                    mid = rev_chatgpt_web_send(api, current.pointer.account, current.guide,
+                                               registry=self.__accounts, reservation=current.pointer.title)
+                except Exception:
+                    self.__accounts.release(current.pointer.title)
+                    raise
 
                 # 设置新建会话的标题
                 new_message = GetMessageResponse.from_body(call_until_success(lambda: api.get(mid)))
@@ -289,12 +533,12 @@ class Scheduler:
                     # 如果没有消息内容，则需要分类
                     mid = rev_chatgpt_web_send(
                         api, current.pointer.account, last_message.remark["classify_prompt"],
-                        current.pointer.id, current.pointer.mid,
+                        current.pointer.id, current.pointer.mid, registry=self.__accounts,
                     )
                 else:
                     mid = rev_chatgpt_web_send(
                         api, current.pointer.account, last_message.content,
-                        current.pointer.id, current.pointer.mid,
+                        current.pointer.id, current.pointer.mid, registry=self.__accounts,
                     )
             else:
                 # 总 token 已满，需要压缩
@@ -302,7 +546,7 @@ class Scheduler:
                 assert current.messages[-1].sender == Message.AI  # 最后一条消息必须是 AI
                 mid = rev_chatgpt_web_send(
                     api, current.pointer.account, current.pointer.prompt,
-                    current.pointer.id, current.pointer.mid,
+                    current.pointer.id, current.pointer.mid, registry=self.__accounts,
                 )
 
             return mid
@@ -328,7 +572,8 @@ class Scheduler:
         else:
             raise error.NotImplementedError1(f"no such engine: f{current.pointer.engine}")
 
-    def get(self, pointer: EnginePointer, stop=False) -> GetMessageResponse:
+    # offset 不为 0 时只返回 offset 之后新增的文本
+    def get(self, pointer: EnginePointer, stop=False, offset=0) -> GetMessageResponse:
         assert pointer.engine in self.__engines
 
         if pointer.engine == RevChatGPTWeb.__name__:
@@ -337,19 +582,23 @@ class Scheduler:
 
             new_message = GetMessageResponse.from_body(
                 call_until_success(lambda: api.get(pointer.new_mid, stop)))
+            if new_message.end:
+                self.__accounts.finished(pointer.new_mid)
         elif pointer.engine == OpenAIChatCompletion.__name__:
             raise error.NotImplementedError1(f"get() not support engine: f{pointer.engine}")
         else:
             raise error.NotImplementedError1(f"no such engine: f{pointer.engine}")
-        return new_message
+        return new_message.after(offset)
 
-    def get_rev_chatgpt_web(self, mid: str, stop=False) -> GetMessageResponse:
+    def get_rev_chatgpt_web(self, mid: str, stop=False, offset=0) -> GetMessageResponse:
         # 使用网页版的免费 ChatGPT
         api: RevChatGPTWeb = self.__engines[RevChatGPTWeb.__name__]
 
         new_message = GetMessageResponse.from_body(
             call_until_success(lambda: api.get(mid, stop)))
-        return new_message
+        if new_message.end:
+            self.__accounts.finished(mid)
+        return new_message.after(offset)
 
     def clean(self, pointer: EnginePointer):
         if pointer.engine == RevChatGPTWeb.__name__:
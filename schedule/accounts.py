@@ -0,0 +1,172 @@
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Tuple
+
+import error
+from engine.rev_chatgpt_web import AccountInfo
+
+# 本地统计折算成负载时的权重，与后端的 counter 同一个量级（后端出错时一次会增加 30~150）
+IN_FLIGHT_WEIGHT = 10.0  # 每个正在进行的请求
+ERROR_WEIGHT = 30.0  # 每个最近的错误
+LATENCY_WEIGHT = 5.0  # 发送延迟每秒
+ERROR_HALF_LIFE = 60.0  # 错误计数减半的秒数
+RESERVATION_TTL = 60.0  # 选中帐号后等待发送的最长秒数
+IN_FLIGHT_TTL = 600.0  # 一直没有完成的回复超过该秒数后不再计入
+
+
+# 一个帐号在本地观察到的负载
+class AccountLoad:
+    def __init__(self):
+        self.reserved: Dict[str, float] = {}  # 已选中但还没有发送的放置与选中的时间
+        self.in_flight: Dict[str, float] = {}  # 正在生成的回复 mid 与开始时间
+        self.errors: float = 0.0
+        self.errors_time: float = time.time()
+        self.latency: float = 0.0  # 发送延迟的滑动平均
+
+    def expire(self, now: float):
+        for owner in [owner for owner, start in self.reserved.items() if now - start > RESERVATION_TTL]:
+            del self.reserved[owner]
+        for mid in [mid for mid, start in self.in_flight.items() if now - start > IN_FLIGHT_TTL]:
+            del self.in_flight[mid]
+        self.errors *= 0.5 ** ((now - self.errors_time) / ERROR_HALF_LIFE)
+        self.errors_time = now
+
+    def score(self) -> float:
+        return (len(self.reserved) + len(self.in_flight)) * IN_FLIGHT_WEIGHT + \
+            self.errors * ERROR_WEIGHT + self.latency * LATENCY_WEIGHT
+
+    def asdict(self) -> dict:
+        return {
+            "reserved": len(self.reserved),
+            "in_flight": len(self.in_flight),
+            "errors": round(self.errors, 3),
+            "latency": round(self.latency, 3),
+        }
+
+
+# 帐号列表的缓存，按 level 保存最近一次从后端得到的可用帐号，过期或者帐号出错后才重新请求
+# 同时在本地统计每个帐号正在进行的请求、最近的错误与延迟，与后端的负载一起决定新会话放在哪个帐号
+class AccountRegistry:
+    LEAST = "least"  # 选择负载最低的帐号
+    TWO_CHOICES = "two_choices"  # 随机选两个帐号，取负载较低的
+
+    def __init__(self, fetch: Callable[[int], List[AccountInfo]], ttl: float, placement: str = LEAST):
+        if placement not in (AccountRegistry.LEAST, AccountRegistry.TWO_CHOICES):
+            raise error.InvalidParamError(f"invalid placement: {placement}")
+        self.__fetch: Callable[[int], List[AccountInfo]] = fetch
+        self.__ttl: float = ttl
+        self.__placement: str = placement
+        self.__lock = threading.Lock()
+        self.__fetching: Dict[int, threading.Lock] = {}  # 同一个 level 同时只有一个请求
+        self.__accounts: Dict[int, Tuple[float, List[AccountInfo]]] = {}
+        self.__loads: Dict[str, AccountLoad] = {}
+        self.__decisions: Deque[dict] = deque(maxlen=32)  # 最近的放置决定
+
+        self.__hits: int = 0
+        self.__refreshes: int = 0
+        self.__invalidations: int = 0
+
+    def accounts(self, level: int) -> List[AccountInfo]:
+        accounts = self.__cached(level)
+        if accounts is not None:
+            return accounts
+        with self.__lock:
+            fetching = self.__fetching.setdefault(level, threading.Lock())
+        with fetching:
+            # 等待期间其他线程可能已经刷新过了
+            accounts = self.__cached(level)
+            if accounts is not None:
+                return accounts
+            accounts = self.__fetch(level)
+            with self.__lock:
+                self.__accounts[level] = (time.time(), accounts)
+                self.__refreshes += 1
+            return accounts
+
+    # 帐号返回了 401/404/409/429 等错误，丢弃包含它的缓存，下次重新请求，并记为一次错误
+    def invalidate(self, account: str):
+        with self.__lock:
+            for level in list(self.__accounts):
+                if any(info.id == account for info in self.__accounts[level][1]):
+                    del self.__accounts[level]
+            self.__invalidations += 1
+            load = self.__load(account)
+            load.errors += 1
+
+    # 为新会话选择帐号， load 为后端给出的负载
+    # 选中后立即记为 owner 的预约，同一时刻的大量新会话会看到彼此，均匀地分散到各个帐号
+    # 每个 owner 只有一个预约，重新放置时替换之前的；预约在 owner 发送成功或者 release 时取消
+    def place(self, accounts: List[AccountInfo], load: Callable[[AccountInfo], int], owner: str) -> str:
+        with self.__lock:
+            self.__release(owner)
+            scores = {info.id: load(info) + self.__load(info.id).score() for info in accounts}
+            candidates = accounts
+            if self.__placement == AccountRegistry.TWO_CHOICES and len(accounts) > 2:
+                candidates = random.sample(accounts, 2)
+            chosen = min(candidates, key=lambda info: (scores[info.id], random.random())).id
+            self.__load(chosen).reserved[owner] = time.time()
+            self.__decisions.append({
+                "time": time.time(),
+                "account": chosen,
+                "scores": {info.id: round(scores[info.id], 3) for info in candidates},
+            })
+            return chosen
+
+    # 消息发送成功，开始生成回复， owner 为放置时的 owner ，不是新放置的发送为空
+    def sent(self, account: str, mid: str, latency: float, owner: str = ""):
+        with self.__lock:
+            load = self.__load(account)
+            load.reserved.pop(owner, None)
+            load.in_flight[mid] = time.time()
+            load.latency = latency if load.latency == 0 else load.latency * 0.8 + latency * 0.2
+
+    # 放置的结果没有被使用
+    def release(self, owner: str):
+        with self.__lock:
+            self.__release(owner)
+
+    # 回复生成完成
+    def finished(self, mid: str):
+        with self.__lock:
+            for load in self.__loads.values():
+                if load.in_flight.pop(mid, None) is not None:
+                    return
+
+    def stats(self) -> dict:
+        with self.__lock:
+            now = time.time()
+            for load in self.__loads.values():
+                load.expire(now)
+            return {
+                "ttl": self.__ttl,
+                "levels": len(self.__accounts),
+                "hits": self.__hits,
+                "refreshes": self.__refreshes,
+                "invalidations": self.__invalidations,
+                "placement": self.__placement,
+                "loads": {account: load.asdict() for account, load in self.__loads.items()},
+                "decisions": list(self.__decisions),
+            }
+
+    def __release(self, owner: str):
+        for load in self.__loads.values():
+            if load.reserved.pop(owner, None) is not None:
+                return
+
+    def __load(self, account: str) -> AccountLoad:
+        load = self.__loads.get(account)
+        if load is None:
+            load = AccountLoad()
+            self.__loads[account] = load
+        load.expire(time.time())
+        return load
+
+    def __cached(self, level: int) -> List[AccountInfo] | None:
+        with self.__lock:
+            cached = self.__accounts.get(level)
+            if cached is None or time.time() - cached[0] >= self.__ttl:
+                return None
+            self.__hits += 1
+            return cached[1]
@@ -0,0 +1,93 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, List, Tuple
+
+from memory import Message
+from tokenizer import exceeds
+
+
+class ClassifyBatch:
+    def __init__(self, level: int, build: Callable[[List[Message]], str], parse: Callable[[str, int], List[str]]):
+        self.level: int = level
+        self.build: Callable[[List[Message]], str] = build  # 把多条消息合并为一个分类提示词
+        self.parse: Callable[[str, int], List[str]] = parse  # 从回复中取出每条消息的分类结果
+        self.items: List[Tuple[Message, Future]] = []
+        self.full = threading.Event()
+
+
+# 合并短时间内多个会话的消息分类：第一条消息到达后等待 window 秒或者凑满 size 条，编号后作为一次性消息发送，
+# 再把回复中每条消息的分类结果交给各自的会话
+# 结果为 None 的会话自己发送分类请求：只有一条消息、提示词过长放不下，或者回复中没有找到它的结果
+class ClassifyBatcher:
+    def __init__(self, send: Callable[[str, int], str], window: float, size: int):
+        self.__lock = threading.Lock()
+        self.__send: Callable[[str, int], str] = send
+        self.__window: float = window
+        self.__size: int = max(size, 2)
+        self.__batches: Dict[Hashable, ClassifyBatch] = {}  # 正在收集的批次
+
+        self.__sent: int = 0  # 发送的批次数
+        self.__items: int = 0  # 提交的消息数
+        self.__batched: int = 0  # 通过合并得到分类结果的消息数
+
+    def enabled(self) -> bool:
+        return self.__window > 0
+
+    # key 相同的消息才能合并，通常为会话类型；返回的 Future 的结果为分类结果或者 None
+    def submit(self, key: Hashable, level: int, message: Message, build: Callable[[List[Message]], str],
+               parse: Callable[[str, int], List[str]]) -> Future:
+        future = Future()
+        future.set_running_or_notify_cancel()
+        key = (key, level)
+        with self.__lock:
+            self.__items += 1
+            batch = self.__batches.get(key)
+            if batch is None:
+                batch = ClassifyBatch(level, build, parse)
+                self.__batches[key] = batch
+                threading.Thread(target=self.__run, args=(key, batch), daemon=True).start()
+            batch.items.append((message, future))
+            if len(batch.items) >= self.__size:
+                del self.__batches[key]
+                batch.full.set()
+        return future
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                "window": self.__window,
+                "size": self.__size,
+                "collecting": len(self.__batches),
+                "sent": self.__sent,
+                "items": self.__items,
+                "batched": self.__batched,
+                "average": self.__batched / self.__sent if self.__sent != 0 else 0.0,
+            }
+
+    def __run(self, key: Hashable, batch: ClassifyBatch):
+        batch.full.wait(self.__window)
+        with self.__lock:
+            if self.__batches.get(key) is batch:
+                del self.__batches[key]
+            items = list(batch.items)
+
+        # 一次性消息最多 1536 个 token ，放不下的消息由会话自己分类
+        count = len(items)
+        prompt = batch.build([message for message, _ in items]) if count > 1 else ""
+        while count > 1 and exceeds(prompt, 1536):
+            count -= 1
+            prompt = batch.build([message for message, _ in items[:count]])
+        results: List[str] = []
+        if count > 1:
+            try:
+                reply = self.__send(prompt, batch.level)
+                results = batch.parse(reply, count)
+            except Exception as err:
+                print(f"合并分类错误： {err}")
+            else:
+                with self.__lock:
+                    self.__sent += 1
+                    self.__batched += sum(1 for result in results if len(result) != 0)
+        for i, (_, future) in enumerate(items):
+            result = results[i] if i < len(results) else ""
+            future.set_result(result if len(result) != 0 else None)
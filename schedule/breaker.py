@@ -0,0 +1,142 @@
+import threading
+import time
+from typing import Dict
+
+
+# 熔断器：连续失败达到阈值后打开，冷却一段时间后半开，只放少量的试探请求通过，试探成功后关闭
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold: int, cooldown: float, probes: int):
+        self.__cond = threading.Condition()
+        self.__threshold: int = threshold
+        self.__cooldown: float = cooldown
+        self.__probes: int = probes
+        self.__state: str = CircuitBreaker.CLOSED
+        self.__failures: int = 0  # 连续失败的次数
+        self.__opened: float = 0.0
+        self.__probing: int = 0  # 半开状态下正在进行的试探请求数
+
+        self.__transitions: Dict[str, int] = {}
+        self.__blocked: int = 0  # 被挡住等待的请求数
+
+    # 没有打开，或者冷却时间已过可以试探
+    def available(self) -> bool:
+        with self.__cond:
+            return self.__state != CircuitBreaker.OPEN or time.time() - self.__opened >= self.__cooldown
+
+    # 等到允许发送请求，之后必须调用 success、 failure 或 release 之一
+    def wait(self):
+        with self.__cond:
+            blocked = False
+            while True:
+                if self.__admit():
+                    return
+                if not blocked:
+                    blocked = True
+                    self.__blocked += 1
+                if self.__state == CircuitBreaker.OPEN:
+                    self.__cond.wait(self.__cooldown - (time.time() - self.__opened))
+                else:
+                    self.__cond.wait()
+
+    # 不等待，允许发送请求时返回 True ，之后必须调用 success、 failure 或 release 之一
+    def acquire(self) -> bool:
+        with self.__cond:
+            if self.__admit():
+                return True
+            self.__blocked += 1
+            return False
+
+    def success(self):
+        with self.__cond:
+            self.__failures = 0
+            if self.__state == CircuitBreaker.HALF_OPEN:
+                self.__probing = max(self.__probing - 1, 0)
+                self.__transit(CircuitBreaker.CLOSED)
+
+    def failure(self):
+        with self.__cond:
+            self.__failures += 1
+            if self.__state == CircuitBreaker.HALF_OPEN:
+                self.__probing = max(self.__probing - 1, 0)
+                self.__open()
+            elif self.__state == CircuitBreaker.CLOSED and self.__failures >= self.__threshold:
+                self.__open()
+
+    # 请求的结果不能说明服务是否正常
+    def release(self):
+        with self.__cond:
+            if self.__state == CircuitBreaker.HALF_OPEN:
+                self.__probing = max(self.__probing - 1, 0)
+                self.__cond.notify_all()
+
+    def stats(self) -> dict:
+        with self.__cond:
+            return {
+                "state": self.__state,
+                "failures": self.__failures,
+                "blocked": self.__blocked,
+                "transitions": dict(self.__transitions),
+            }
+
+    def __admit(self) -> bool:
+        if self.__state == CircuitBreaker.OPEN and time.time() - self.__opened >= self.__cooldown:
+            self.__transit(CircuitBreaker.HALF_OPEN)
+        if self.__state == CircuitBreaker.CLOSED:
+            return True
+        if self.__state == CircuitBreaker.HALF_OPEN and self.__probing < self.__probes:
+            self.__probing += 1
+            return True
+        return False
+
+    def __open(self):
+        self.__opened = time.time()
+        self.__transit(CircuitBreaker.OPEN)
+
+    def __transit(self, state: str):
+        transition = f"{self.__state}->{state}"
+        self.__transitions[transition] = self.__transitions.get(transition, 0) + 1
+        self.__state = state
+        if state != CircuitBreaker.HALF_OPEN:
+            self.__probing = 0
+        self.__cond.notify_all()
+
+
+# 按引擎和帐号划分的熔断器
+class Breakers:
+    ENGINE = "engine"
+    ACCOUNT = "account"
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__threshold: int = 5
+        self.__cooldown: float = 30.0
+        self.__probes: int = 1
+        self.__breakers: Dict[str, CircuitBreaker] = {}
+
+    def configure(self, threshold: int, cooldown: float, probes: int):
+        with self.__lock:
+            self.__threshold = threshold
+            self.__cooldown = cooldown
+            self.__probes = max(probes, 1)
+            self.__breakers.clear()
+
+    def get(self, kind: str, name: str) -> CircuitBreaker:
+        key = f"{kind}:{name}"
+        with self.__lock:
+            breaker = self.__breakers.get(key)
+            if breaker is None:
+                breaker = CircuitBreaker(self.__threshold, self.__cooldown, self.__probes)
+                self.__breakers[key] = breaker
+            return breaker
+
+    def stats(self) -> dict:
+        with self.__lock:
+            breakers = dict(self.__breakers)
+        return {key: breaker.stats() for key, breaker in breakers.items()}
+
+
+breakers = Breakers()
@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Hashable, Tuple
+
+
+# 合并同时进行的相同请求：第一个请求真正执行，之后到达的相同请求等待它的结果
+# ttl 大于 0 时，完成的结果再缓存 ttl 秒，最多缓存 size 个
+class SingleFlight:
+    def __init__(self, ttl: float = 0.0, size: int = 256):
+        self.__lock = threading.Lock()
+        self.__ttl: float = ttl
+        self.__size: int = size
+        self.__flights: Dict[Hashable, Future] = {}
+        self.__cache: OrderedDict[Hashable, Tuple[float, object]] = OrderedDict()
+
+        self.__requests: int = 0
+        self.__shared: int = 0  # 等待了正在进行的相同请求的次数
+        self.__hits: int = 0  # 命中缓存的次数
+
+    # 返回 key 对应的 Future ，以及调用者是否需要自己执行并调用 done 或 fail
+    def join(self, key: Hashable) -> Tuple[Future, bool]:
+        with self.__lock:
+            self.__requests += 1
+            cached = self.__cache.get(key)
+            if cached is not None:
+                if time.time() - cached[0] < self.__ttl:
+                    self.__hits += 1
+                    future = Future()
+                    future.set_result(cached[1])
+                    return future, False
+                del self.__cache[key]
+
+            future = self.__flights.get(key)
+            if future is not None:
+                self.__shared += 1
+                return future, False
+
+            future = Future()
+            # 进入运行状态后，等待者取消等待不会取消这个 Future
+            future.set_running_or_notify_cancel()
+            self.__flights[key] = future
+            return future, True
+
+    def done(self, key: Hashable, result):
+        with self.__lock:
+            future = self.__flights.pop(key)
+            if self.__ttl > 0:
+                self.__cache[key] = (time.time(), result)
+                self.__cache.move_to_end(key)
+                while len(self.__cache) > self.__size:
+                    self.__cache.popitem(last=False)
+        future.set_result(result)
+
+    # 失败的结果不缓存，等待者得到同样的异常
+    def fail(self, key: Hashable, err: BaseException):
+        with self.__lock:
+            future = self.__flights.pop(key)
+        future.set_exception(err)
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                "ttl": self.__ttl,
+                "size": len(self.__cache),
+                "in_flight": len(self.__flights),
+                "requests": self.__requests,
+                "shared": self.__shared,
+                "hits": self.__hits,
+            }
@@ -0,0 +1,49 @@
+import threading
+from collections import deque
+from typing import Deque
+
+
+# 一次性消息从发送到开始生成回复的耗时统计，用于决定何时向第二个帐号发出对冲请求
+class HedgeStats:
+    def __init__(self, percentile: float, delay: float, samples: int = 200):
+        self.__lock = threading.Lock()
+        self.__percentile: float = percentile
+        self.__delay: float = delay  # 样本不足时使用的等待秒数
+        self.__samples: Deque[float] = deque(maxlen=samples)
+
+        self.__requests: int = 0
+        self.__hedged: int = 0  # 发出了对冲请求的次数
+        self.__hedge_wins: int = 0  # 对冲请求先完成的次数
+
+    # 记录一次从发送到开始生成回复的秒数
+    def record(self, seconds: float):
+        with self.__lock:
+            self.__samples.append(seconds)
+
+    # 超过该秒数还没有开始生成回复时发出对冲请求
+    def deadline(self) -> float:
+        with self.__lock:
+            if len(self.__samples) < 10:
+                return self.__delay
+            samples = sorted(self.__samples)
+            return samples[min(int(len(samples) * self.__percentile), len(samples) - 1)]
+
+    def count(self, hedged: bool, hedge_won: bool):
+        with self.__lock:
+            self.__requests += 1
+            if hedged:
+                self.__hedged += 1
+            if hedge_won:
+                self.__hedge_wins += 1
+
+    def stats(self) -> dict:
+        deadline = self.deadline()
+        with self.__lock:
+            return {
+                "percentile": self.__percentile,
+                "deadline": deadline,
+                "samples": len(self.__samples),
+                "requests": self.__requests,
+                "hedged": self.__hedged,
+                "hedge_wins": self.__hedge_wins,
+            }
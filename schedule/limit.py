@@ -0,0 +1,98 @@
+import threading
+import time
+from typing import Dict, Tuple
+
+
+# 令牌桶限流，等待的请求按到达顺序排队，先到先得
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.__cond = threading.Condition()
+        self.__rate: float = rate  # 每秒补充的令牌数
+        self.__burst: int = burst  # 最多积攒的令牌数
+        self.__tokens: float = burst
+        self.__time: float = time.time()
+        self.__ticket: int = 0  # 下一个到达的请求的号码
+        self.__serving: int = 0  # 正在等待令牌的请求的号码
+
+        self.__acquired: int = 0
+        self.__waited: float = 0.0
+        self.__max_wait: float = 0.0
+
+    # 等待取得一个令牌，返回等待的秒数
+    def acquire(self) -> float:
+        start = time.time()
+        with self.__cond:
+            ticket = self.__ticket
+            self.__ticket += 1
+            while True:
+                if ticket != self.__serving:
+                    self.__cond.wait()
+                    continue
+                self.__refill()
+                if self.__tokens >= 1:
+                    break
+                self.__cond.wait((1 - self.__tokens) / self.__rate)
+            self.__tokens -= 1
+            self.__serving += 1
+            self.__cond.notify_all()
+
+            wait = time.time() - start
+            self.__acquired += 1
+            self.__waited += wait
+            self.__max_wait = max(self.__max_wait, wait)
+        return wait
+
+    def stats(self) -> dict:
+        with self.__cond:
+            self.__refill()
+            return {
+                "rate": self.__rate,
+                "burst": self.__burst,
+                "tokens": round(self.__tokens, 3),
+                "depth": self.__ticket - self.__serving,
+                "acquired": self.__acquired,
+                "average_wait": self.__waited / self.__acquired if self.__acquired != 0 else 0.0,
+                "max_wait": self.__max_wait,
+            }
+
+    def __refill(self):
+        now = time.time()
+        self.__tokens = min(self.__tokens + (now - self.__time) * self.__rate, self.__burst)
+        self.__time = now
+
+
+# 按类别（帐号、 openai 的 key）和名称划分的限流器，在发送请求前主动等待，而不是等后端返回 429 后再重试
+class Limiters:
+    ACCOUNT = "account"
+    OPENAI = "openai"
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__configs: Dict[str, Tuple[float, int]] = {}  # 类别的速率与突发数，速率为 0 时不限流
+        self.__buckets: Dict[str, TokenBucket] = {}
+
+    def configure(self, kind: str, rate: float, burst: int):
+        with self.__lock:
+            self.__configs[kind] = (rate, max(burst, 1))
+            for key in [key for key in self.__buckets if key.startswith(kind + ":")]:
+                del self.__buckets[key]
+
+    def acquire(self, kind: str, name: str) -> float:
+        key = f"{kind}:{name}"
+        with self.__lock:
+            bucket = self.__buckets.get(key)
+            if bucket is None:
+                rate, burst = self.__configs.get(kind, (0.0, 1))
+                if rate <= 0:
+                    return 0.0
+                bucket = TokenBucket(rate, burst)
+                self.__buckets[key] = bucket
+        return bucket.acquire()
+
+    def stats(self) -> dict:
+        with self.__lock:
+            buckets = dict(self.__buckets)
+        return {key: bucket.stats() for key, bucket in buckets.items()}
+
+
+limiters = Limiters()
@@ -0,0 +1,138 @@
+import threading
+import time
+from typing import Callable, Dict
+
+import error
+
+# 轮询的类别
+INTERACTIVE = "interactive"  # 有人在等待的回复，尽快轮询
+BACKGROUND = "background"  # 后台的压缩、继承等，慢慢轮询
+
+# 各个等待回复的循环所属的类别
+loops = {
+    "send": INTERACTIVE,
+    "classify": INTERACTIVE,
+    "away": INTERACTIVE,
+    "inherit": BACKGROUND,
+    "summarize": BACKGROUND,
+    "merge": BACKGROUND,
+}
+
+
+# 固定间隔轮询
+class FixedPoll:
+    def __init__(self, interval: float):
+        self.__interval: float = interval
+
+    def next(self, length: int) -> float:
+        return self.__interval
+
+
+# 根据回复增长的速度调整间隔：每次轮询大约拿到 chunk 个新字符，回复没有增长时逐渐退避
+class AdaptivePoll:
+    def __init__(self, interval: float, upper: float, chunk: int):
+        self.__base: float = interval
+        self.__upper: float = upper
+        self.__chunk: int = chunk
+        self.__interval: float = interval
+        self.__rate: float = 0.0  # 每秒增长字符数的滑动平均
+        self.__length: int = 0
+        self.__time: float = time.time()
+
+    def next(self, length: int) -> float:
+        now = time.time()
+        grown = length - self.__length
+        elapsed = now - self.__time
+        self.__length = length
+        self.__time = now
+        if grown > 0 and elapsed > 0:
+            rate = grown / elapsed
+            self.__rate = rate if self.__rate == 0 else self.__rate * 0.5 + rate * 0.5
+            self.__interval = self.__chunk / self.__rate
+        else:
+            self.__interval *= 1.5
+        self.__interval = min(max(self.__interval, self.__base), self.__upper)
+        return self.__interval
+
+
+# 一个等待回复的循环，按类别与是否有人在看选择间隔，并记录请求次数
+class PollLoop:
+    def __init__(self, poller, name: str, watched: Callable[[], bool] | None):
+        self.__poller = poller
+        self.__name: str = name
+        self.__watched: Callable[[], bool] | None = watched
+        self.__interactive = poller.policy(INTERACTIVE)
+        self.__background = poller.policy(BACKGROUND)
+
+    # 记录一次请求，返回到下一次请求前需要等待的秒数
+    def next(self, length: int) -> float:
+        if self.__watched is not None:
+            interactive = self.__watched()
+        else:
+            interactive = loops.get(self.__name, INTERACTIVE) == INTERACTIVE
+        # 两个策略都要更新，切换时才能接上回复增长的速度
+        interactive_interval = self.__interactive.next(length)
+        background_interval = self.__background.next(length)
+        interval = interactive_interval if interactive else background_interval
+        self.__poller.count(self.__name, interval)
+        return interval
+
+
+# 所有等待回复的循环共用的轮询策略与统计
+class Poller:
+    FIXED = "fixed"
+    ADAPTIVE = "adaptive"
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__policy: str = Poller.ADAPTIVE
+        self.__intervals: Dict[str, float] = {INTERACTIVE: 0.1, BACKGROUND: 1.0}
+        self.__backoff: float = 10.0
+        self.__chunk: int = 8
+        self.__loops: Dict[str, int] = {}
+        self.__polls: Dict[str, int] = {}
+        self.__waits: Dict[str, float] = {}
+
+    def configure(self, policy: str, interactive: float, background: float, backoff: float, chunk: int):
+        if policy not in (Poller.FIXED, Poller.ADAPTIVE):
+            raise error.InvalidParamError(f"invalid poll policy: {policy}")
+        with self.__lock:
+            self.__policy = policy
+            self.__intervals = {INTERACTIVE: interactive, BACKGROUND: background}
+            self.__backoff = backoff
+            self.__chunk = chunk
+
+    def policy(self, kind: str):
+        interval = self.__intervals[kind]
+        if self.__policy == Poller.FIXED:
+            return FixedPoll(interval)
+        return AdaptivePoll(interval, interval * self.__backoff, self.__chunk)
+
+    # 开始一个等待回复的循环， watched 返回是否有人在看，有人在看时按 interactive 轮询
+    def loop(self, name: str, watched: Callable[[], bool] | None = None) -> PollLoop:
+        with self.__lock:
+            self.__loops[name] = self.__loops.get(name, 0) + 1
+        return PollLoop(self, name, watched)
+
+    def count(self, name: str, interval: float):
+        with self.__lock:
+            self.__polls[name] = self.__polls.get(name, 0) + 1
+            self.__waits[name] = self.__waits.get(name, 0.0) + interval
+
+    def stats(self) -> dict:
+        with self.__lock:
+            result = {}
+            for name in self.__loops:
+                polls = self.__polls.get(name, 0)
+                result[name] = {
+                    "loops": self.__loops[name],
+                    "polls": polls,
+                    "average_interval": self.__waits.get(name, 0.0) / polls if polls != 0 else 0.0,
+                }
+            return {
+                "policy": self.__policy,
+                "loops": result,
+            }
+
+
+poller = Poller()
@@ -4,3 +4,4 @@ app = flask.Flask(__name__)
 
 from server.index import *
 from server.session import *
+from server.stats import *
@@ -1,4 +1,5 @@
 import http
+import json
 from dataclasses import asdict
 
 import flask
@@ -167,14 +168,95 @@ def handle_get():
         return r
 
     stop = flask.request.method == 'PATCH'
+    since = flask.request.args.get('since', type=int)
+    if since is not None and not stop:
+        return long_poll(session, since)
     try:
         m = session.get(stop)
     except error.ChatGPTSessionError as e:
         return flask.make_response(str(e), e.HttpStatus)
 
+    # 客户端已经有了这条回复的前 offset 个字符时只返回新增的部分
+    # 必须同时给出 mid ，回复已经换成另一条时返回完整的回复
+    offset = flask.request.args.get('offset', type=int, default=0)
+    mid = flask.request.args.get('mid')
+    if mid is not None and len(m.mid) != 0 and mid == m.mid:
+        m = m.after(offset)
     return flask.jsonify(asdict(m))
 
 
+# 长轮询：阻塞到回复的版本号大于 since 或者超时，只返回 offset 之后新增的文本
+def long_poll(session: Session, since: int) -> flask.Response:
+    wait = min(flask.request.args.get('wait', type=float, default=30), 60)
+    offset = flask.request.args.get('offset', type=int, default=0)
+    try:
+        snapshot = session.reply_snapshot()
+        if snapshot.version <= since:
+            snapshot = session.wait_reply(since, wait)
+        if snapshot.end and len(snapshot.mid) == 0:
+            # 加载以来还没有生成过回复，给出最后一条回复
+            m = session.get()
+            return flask.jsonify({"version": snapshot.version, "mid": m.mid, "offset": 0, "msg": m.msg, "end": m.end})
+    except error.ChatGPTSessionError as e:
+        return flask.make_response(str(e), e.HttpStatus)
+
+    offset, msg = snapshot.delta(since, offset)
+    return flask.jsonify({
+        "version": snapshot.version,
+        "mid": snapshot.mid,
+        "offset": offset,
+        "msg": msg,
+        "end": snapshot.end,
+    })
+
+
+# 以 Server-Sent Events 推送正在生成的回复，每个事件只包含新增的文本
+# 无论有多少个客户端在看，后端都只由会话的工作线程轮询一次
+@app.route('/api/session/stream')
+def handle_stream():
+    id_ = flask.request.args.get('id')
+    session, r = get_session_query(id_)
+    if r is not None:
+        return r
+
+    try:
+        snapshot = session.reply_snapshot()
+        if snapshot.end:
+            # 没有正在生成的回复，直接给出最后一条回复
+            m = session.get()
+    except error.ChatGPTSessionError as e:
+        return flask.make_response(str(e), e.HttpStatus)
+
+    def event(data: dict) -> str:
+        return "data: " + json.dumps(data, ensure_ascii=False) + "\n\n"
+
+    def generate():
+        if snapshot.end:
+            yield event({"mid": m.mid, "offset": 0, "msg": m.msg, "end": m.end})
+            return
+        current, mid, sent = snapshot, "", ""
+        while True:
+            if current.mid == mid and current.msg.startswith(sent):
+                offset = len(sent)
+            else:
+                offset = 0
+            delta = current.msg[offset:]
+            if len(delta) != 0 or current.mid != mid or current.end:
+                yield event({"mid": current.mid, "offset": offset, "msg": delta, "end": current.end})
+                mid, sent = current.mid, current.msg
+            if current.end:
+                return
+            version = current.version
+            current = session.wait_reply(version, 15)
+            if current.version == version:
+                yield ": keepalive\n\n"  # 防止代理因空闲断开连接
+
+    return flask.Response(generate(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
 @app.route('/api/session/status')
 def handle_status():
     id_ = flask.request.args.get('id')
@@ -0,0 +1,29 @@
+import flask
+
+import tokenizer
+from schedule.poll import poller
+from server import app
+from server.common import globalObject
+from session.classifier import local_classifier
+from session.classify import classify_cache
+from session.flush import flusher
+
+
+@app.route('/api/stats')
+def handle_stats():
+    return flask.jsonify({
+        "tokenizer": {
+            "backend": tokenizer.backend_info(),
+            "cache": tokenizer.cache_stats(),
+        },
+        "sessions": globalObject.session_manager.stats(),
+        "poll": poller.stats(),
+        "schedule": globalObject.scheduler.stats(),
+        "classify": {
+            "cache": classify_cache.stats(),
+            "local": local_classifier.stats(),
+        },
+        "storage": {
+            "flush": flusher.stats(),
+        },
+    })
@@ -0,0 +1,225 @@
+import json
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import error
+from session.classify import normalize
+
+NGRAMS = (1, 2, 3)  # 使用的字符 n-gram 长度
+MAX_CHARS = 512  # 只取消息开头的字符数
+RESULT = re.compile(r'Classification:\s*([A-Q])')  # 规则中的分类为 A 到 Q
+
+
+# 消息原文的特征：归一化后的字符 n-gram （带首尾标记）与长度区间
+def features(raw: str) -> List[str]:
+    text = normalize(raw)[:MAX_CHARS]
+    marked = "^" + text + "$"
+    result = [f"\0len:{min(len(text) // 4, 16)}"]
+    for n in NGRAMS:
+        for i in range(len(marked) - n + 1):
+            result.append(marked[i:i + n])
+    return result
+
+
+# 从 ChatGPT 的分类回复中取出分类字母，没有时返回空字符串
+def parse_category(result: str) -> str:
+    match = RESULT.search(result)
+    if match is None:
+        return ""
+    return match.group(1)
+
+
+# 多项式朴素贝叶斯，特征只记是否出现；每个分类单独的置信度阈值，没有阈值的分类不在本地回答
+class NaiveBayes:
+    def __init__(self, classes: List[str], priors: List[float], weights: Dict[str, List[float]],
+                 thresholds: Dict[str, float] | None = None):
+        self.classes: List[str] = classes
+        self.priors: List[float] = priors  # 每个分类的对数先验概率
+        self.weights: Dict[str, List[float]] = weights  # 每个特征在每个分类下的对数概率
+        self.thresholds: Dict[str, float] = thresholds if thresholds is not None else {}
+
+    # samples 为 (消息原文, 分类) ，只出现不到 min_count 次的特征丢弃
+    @staticmethod
+    def train(samples: List[Tuple[str, str]], alpha: float = 0.1, min_count: int = 2):
+        if len(samples) == 0:
+            raise error.InvalidParamError("no samples")
+        classes = sorted({category for _, category in samples})
+        class_index = {category: i for i, category in enumerate(classes)}
+        docs = [0] * len(classes)
+        counts: Dict[str, List[int]] = {}
+        for raw, category in samples:
+            i = class_index[category]
+            docs[i] += 1
+            for feature in set(features(raw)):
+                count = counts.get(feature)
+                if count is None:
+                    count = [0] * len(classes)
+                    counts[feature] = count
+                count[i] += 1
+        counts = {feature: count for feature, count in counts.items() if sum(count) >= min_count}
+
+        totals = [0] * len(classes)
+        for count in counts.values():
+            for i, n in enumerate(count):
+                totals[i] += n
+        vocabulary = len(counts)
+        priors = [math.log(n / len(samples)) for n in docs]
+        weights = {
+            feature: [round(math.log((n + alpha) / (totals[i] + alpha * vocabulary)), 4) for i, n in enumerate(count)]
+            for feature, count in counts.items()
+        }
+        return NaiveBayes(classes, priors, weights)
+
+    # 返回最可能的分类与它的后验概率
+    def predict(self, raw: str) -> Tuple[str, float]:
+        scores = list(self.priors)
+        for feature in set(features(raw)):
+            weight = self.weights.get(feature)
+            if weight is None:
+                continue
+            for i, w in enumerate(weight):
+                scores[i] += w
+        best = max(range(len(scores)), key=lambda i: scores[i])
+        total = sum(math.exp(score - scores[best]) for score in scores)
+        return self.classes[best], 1 / total
+
+    # 有把握时返回分类，否则返回空字符串
+    def answer(self, raw: str) -> str:
+        category, confidence = self.predict(raw)
+        threshold = self.thresholds.get(category)
+        if threshold is None or confidence < threshold:
+            return ""
+        return category
+
+    def to_dict(self) -> dict:
+        return {
+            "classes": self.classes,
+            "priors": self.priors,
+            "weights": self.weights,
+            "thresholds": self.thresholds,
+        }
+
+    @staticmethod
+    def from_dict(d: dict):
+        return NaiveBayes(d["classes"], d["priors"], d["weights"], d.get("thresholds", {}))
+
+
+# 在留出的样本上为每个分类选择置信度阈值：达到阈值的预测中正确的比例不低于 precision ，
+# 并且至少有 min_support 个这样的预测，满足条件时取最低的阈值以回答尽量多的消息
+def calibrate(model: NaiveBayes, samples: List[Tuple[str, str]], precision: float,
+              min_support: int) -> Dict[str, float]:
+    predictions: Dict[str, List[Tuple[float, bool]]] = {}
+    for raw, category in samples:
+        predicted, confidence = model.predict(raw)
+        predictions.setdefault(predicted, []).append((confidence, predicted == category))
+
+    thresholds = {}
+    for category, predicted in predictions.items():
+        predicted.sort(key=lambda p: -p[0])
+        correct = 0
+        for i, (confidence, right) in enumerate(predicted):
+            correct += right
+            if i + 1 < len(predicted) and predicted[i + 1][0] == confidence:
+                continue  # 相同置信度的预测要么都回答，要么都不回答
+            if i + 1 >= min_support and correct / (i + 1) >= precision:
+                thresholds[category] = confidence
+    return thresholds
+
+
+# 每个分类的样本数、不使用阈值时的精确率，以及使用阈值后在本地回答的数量与精确率
+def evaluate(model: NaiveBayes, samples: List[Tuple[str, str]]) -> dict:
+    categories: Dict[str, Counter] = {}
+    correct = 0
+    answered = 0
+    answered_correct = 0
+    for raw, category in samples:
+        predicted, confidence = model.predict(raw)
+        local = model.answer(raw)
+        categories.setdefault(category, Counter())["support"] += 1
+        counter = categories.setdefault(predicted, Counter())
+        counter["predicted"] += 1
+        counter["correct"] += predicted == category
+        correct += predicted == category
+        if len(local) != 0:
+            counter["answered"] += 1
+            counter["answered_correct"] += local == category
+            answered += 1
+            answered_correct += local == category
+
+    report = {
+        "samples": len(samples),
+        "accuracy": correct / len(samples) if len(samples) != 0 else 0.0,
+        "coverage": answered / len(samples) if len(samples) != 0 else 0.0,
+        "precision": answered_correct / answered if answered != 0 else 0.0,
+        "categories": {},
+    }
+    for category in sorted(categories):
+        counter = categories[category]
+        report["categories"][category] = {
+            "support": counter["support"],
+            "predicted": counter["predicted"],
+            "precision": counter["correct"] / counter["predicted"] if counter["predicted"] != 0 else 0.0,
+            "threshold": model.thresholds.get(category),
+            "answered": counter["answered"],
+            "answered_precision":
+                counter["answered_correct"] / counter["answered"] if counter["answered"] != 0 else 0.0,
+        }
+    return report
+
+
+# 本地的分类模型，有把握的消息直接在本地分类，省去一次 ChatGPT 的完整生成
+# 模型文件由 train_classifier.py 生成，分类提示词相同的会话类型共用一个模型
+class LocalClassifier:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__models: Dict[str, NaiveBayes] = {}
+        self.__types: Dict[str, str] = {}  # 会话类型使用的模型名称
+
+        self.__answered: Counter = Counter()
+        self.__deferred: Counter = Counter()
+
+    # 模型文件不存在或者 enabled 为 False 时不在本地分类
+    def configure(self, path: str, enabled: bool):
+        models = {}
+        types = {}
+        if enabled:
+            try:
+                with open(path, "r") as f:
+                    d = json.loads(f.read())
+                models = {name: NaiveBayes.from_dict(model) for name, model in d["models"].items()}
+                types = {type_: name for type_, name in d["types"].items() if name in models}
+            except FileNotFoundError:
+                pass
+            except (json.JSONDecodeError, KeyError, TypeError) as e:
+                raise error.InternalError(f"invalid classify model {path}: {e}")
+        with self.__lock:
+            self.__models = models
+            self.__types = types
+
+    # 返回与 ChatGPT 的分类回复相同格式的结果，没有把握时返回 None
+    def classify(self, type_: str, raw: str) -> str | None:
+        with self.__lock:
+            model = self.__models.get(self.__types.get(type_, ""))
+        if model is None or len(raw) == 0:
+            return None
+        category = model.answer(raw)
+        with self.__lock:
+            if len(category) == 0:
+                self.__deferred[type_] += 1
+                return None
+            self.__answered[type_] += 1
+        return f"Classification: {category}"
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                "types": dict(self.__types),
+                "answered": dict(self.__answered),
+                "deferred": dict(self.__deferred),
+            }
+
+
+local_classifier = LocalClassifier()
@@ -0,0 +1,129 @@
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import error
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS classify (
+    type TEXT NOT NULL,
+    text TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created REAL NOT NULL,
+    used REAL NOT NULL,
+    PRIMARY KEY (type, text)
+);
+CREATE INDEX IF NOT EXISTS classify_used ON classify (used);
+"""
+
+
+# 归一化消息原文：全角半角统一、忽略大小写、合并空白
+def normalize(raw: str) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", raw)).strip().casefold()
+
+
+# 消息分类结果的缓存，按会话类型和归一化后的消息原文保存 ChatGPT 的分类回复，保存在数据库目录下的 SQLite 文件中
+# 问候、表情、常见问题在大量用户之间反复出现，命中后不需要再发给 ChatGPT 分类
+class ClassifyCache:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__connection: sqlite3.Connection | None = None
+        self.__ttl: float = 0.0
+        self.__size: int = 0
+        self.__count: int = 0  # 缓存的条数
+
+        self.__hits: int = 0
+        self.__misses: int = 0
+        self.__puts: int = 0
+        self.__evictions: int = 0
+
+    # ttl 为 0 时不使用缓存
+    def configure(self, path: str, ttl: float, size: int):
+        with self.__lock:
+            if self.__connection is not None:
+                self.__connection.close()
+                self.__connection = None
+            self.__ttl = ttl
+            self.__size = max(size, 1)
+            if ttl <= 0:
+                return
+            try:
+                self.__connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+                self.__connection.execute("PRAGMA journal_mode = WAL")
+                self.__connection.execute("PRAGMA synchronous = OFF")  # 丢失的缓存只是多分类一次
+                self.__connection.executescript(SCHEMA)
+                self.__connection.execute("DELETE FROM classify WHERE created < ?", (time.time() - ttl,))
+                self.__count = self.__connection.execute("SELECT COUNT(*) FROM classify").fetchone()[0]
+            except sqlite3.Error as e:
+                raise error.InternalError(e)
+
+    def get(self, type_: str, raw: str) -> str | None:
+        text = normalize(raw)
+        with self.__lock:
+            if self.__connection is None or len(text) == 0:
+                return None
+            now = time.time()
+            try:
+                row = self.__connection.execute(
+                    "SELECT result, created FROM classify WHERE type = ? AND text = ?", (type_, text)).fetchone()
+                if row is None or now - row[1] >= self.__ttl:
+                    self.__misses += 1
+                    return None
+                self.__connection.execute(
+                    "UPDATE classify SET used = ? WHERE type = ? AND text = ?", (now, type_, text))
+            except sqlite3.Error as e:
+                print(f"读取分类缓存失败： {e}")
+                return None
+            self.__hits += 1
+            return row[0]
+
+    def put(self, type_: str, raw: str, result: str):
+        text = normalize(raw)
+        with self.__lock:
+            if self.__connection is None or len(text) == 0:
+                return
+            now = time.time()
+            try:
+                cursor = self.__connection.execute(
+                    "INSERT OR IGNORE INTO classify (type, text, result, created, used) VALUES (?, ?, ?, ?, ?)",
+                    (type_, text, result, now, now))
+                if cursor.rowcount == 0:
+                    self.__connection.execute(
+                        "UPDATE classify SET result = ?, created = ?, used = ? WHERE type = ? AND text = ?",
+                        (result, now, now, type_, text))
+                self.__count += cursor.rowcount
+                self.__puts += 1
+                if self.__count > self.__size:
+                    self.__evict(now)
+            except sqlite3.Error as e:
+                print(f"写入分类缓存失败： {e}")
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                "enabled": self.__connection is not None,
+                "ttl": self.__ttl,
+                "size": self.__count,
+                "capacity": self.__size,
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "puts": self.__puts,
+                "evictions": self.__evictions,
+            }
+
+    # 先删除过期的，仍然超过上限时删除最久没有使用的，多删十分之一避免每次写入都要淘汰
+    def __evict(self, now: float):
+        deleted = self.__connection.execute("DELETE FROM classify WHERE created < ?", (now - self.__ttl,)).rowcount
+        excess = self.__count - deleted - self.__size
+        if excess > 0:
+            excess += self.__size // 10
+            deleted += self.__connection.execute(
+                "DELETE FROM classify WHERE rowid IN (SELECT rowid FROM classify ORDER BY used LIMIT ?)",
+                (excess,)).rowcount
+        self.__count -= deleted
+        self.__evictions += deleted
+
+
+classify_cache = ClassifyCache()
@@ -0,0 +1,68 @@
+import json
+import os
+from dataclasses import asdict
+from datetime import datetime
+from typing import List
+
+import error
+from config import StorageConfig
+from memory import CurrentConversation
+from session.flush import flusher
+from session.storage import SessionStorage
+
+
+# 每个会话一个目录： index.json、 current.json、 remark.json、 archive/
+class DirectoryDatabase:
+    def __init__(self, path: str, config: StorageConfig = StorageConfig()):
+        self.__path: str = path
+        self.__config: StorageConfig = config
+
+    def list(self) -> List[dict]:
+        result = []
+        try:
+            for id_ in os.listdir(self.__path):
+                if id_.startswith("."):
+                    continue
+                session_path = os.path.join(self.__path, id_)
+                if not os.path.isdir(session_path):
+                    continue
+                try:
+                    with open(os.path.join(session_path, "index.json"), "r") as f:
+                        index = json.loads(f.read())
+                except (FileNotFoundError, json.JSONDecodeError) as e:
+                    print(e)
+                    continue
+                result.append(index)
+        except OSError as e:
+            raise error.InternalError(e)
+        return result
+
+    # 会话已存在时抛出 FileExistsError
+    def create(self, index: dict, current: CurrentConversation | None = None):
+        session_path = os.path.join(self.__path, index["id"])
+        os.makedirs(session_path)
+        flusher.write(os.path.join(session_path, "index.json"),
+                      json.dumps(index, ensure_ascii=False, indent=2).encode('utf-8'))
+        if current is not None:
+            current_str = json.dumps(asdict(current), ensure_ascii=False, indent=2)
+            flusher.write(os.path.join(session_path, "current.json"), current_str.encode('utf-8'))
+
+    def save_index(self, index: dict):
+        flusher.write(os.path.join(self.__path, index["id"], "index.json"), json.dumps(index).encode('utf-8'))
+
+    # 删除的会话重命名为隐藏目录保留
+    def remove(self, id_: str):
+        suffix = datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
+        os.rename(os.path.join(self.__path, id_), os.path.join(self.__path, f".{id_}.{suffix}"))
+
+    def storage(self, index: dict) -> SessionStorage:
+        return SessionStorage(os.path.join(self.__path, index["id"]), index["type"], index["params"], self.__config)
+
+
+def open_database(path: str, config: StorageConfig = StorageConfig()):
+    if config.backend == "directory":
+        return DirectoryDatabase(path, config)
+    if config.backend == "sqlite":
+        from session.sqlite import SQLiteDatabase
+        return SQLiteDatabase(os.path.join(path, config.sqlite_file), config)
+    raise error.InvalidParamError(f"no such storage backend: {config.backend}")
@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+from typing import List
+
+import error
+
+
+class FlushOp:
+    def __init__(self, path: str, tmp: str = ""):
+        self.path: str = path
+        self.tmp: str = tmp  # 不为空时表示需要在 fsync 后重命名为 path
+        self.error: OSError | None = None
+
+
+# 负责把写入的文件落盘，多个会话并发的保存会被合并为一批进行 fsync（group commit）
+class Flusher:
+    # 持久化级别
+    NONE = "none"  # 只保证原子替换，不主动 fsync
+    INTERVAL = "interval"  # 原子替换后立即返回，后台定期 fsync
+    STRICT = "strict"  # 等待 fsync 完成后才返回，并发的请求合并为一批
+
+    def __init__(self, durability: str = STRICT, interval: float = 1.0):
+        self.__lock = threading.Lock()
+        self.__cond = threading.Condition(self.__lock)
+        self.__durability: str = durability
+        self.__interval: float = interval
+        self.__pending: List[FlushOp] = []
+        self.__batch: int = 0  # 正在收集的批次号
+        self.__done: int = 0  # 小于该号的批次都已完成
+        self.__thread: threading.Thread | None = None
+
+        self.__batches: int = 0
+        self.__files: int = 0
+        self.__ops: int = 0
+
+    def configure(self, durability: str, interval: float):
+        if durability not in (Flusher.NONE, Flusher.INTERVAL, Flusher.STRICT):
+            raise error.InvalidParamError(f"invalid durability: {durability}")
+        with self.__lock:
+            self.__durability = durability
+            self.__interval = interval
+
+    # 原子地替换文件内容
+    def write(self, path: str, data: bytes):
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        if self.__durability == Flusher.STRICT:
+            self.__submit(FlushOp(path, tmp))
+            return
+        os.replace(tmp, path)
+        if self.__durability == Flusher.INTERVAL:
+            self.__submit(FlushOp(path))
+
+    # 向文件末尾追加内容
+    def append(self, path: str, data: bytes):
+        with open(path, "ab") as f:
+            f.write(data)
+        if self.__durability != Flusher.NONE:
+            self.__submit(FlushOp(path))
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                "durability": self.__durability,
+                "pending": len(self.__pending),
+                "batches": self.__batches,
+                "files": self.__files,
+                "ops": self.__ops,
+            }
+
+    def __submit(self, op: FlushOp):
+        with self.__lock:
+            self.__pending.append(op)
+            batch = self.__batch
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__loop, daemon=True)
+                self.__thread.start()
+            self.__cond.notify_all()
+            if self.__durability != Flusher.STRICT:
+                return
+            while self.__done <= batch:
+                self.__cond.wait()
+        if op.error is not None:
+            raise op.error
+
+    def __loop(self):
+        while True:
+            with self.__lock:
+                while len(self.__pending) == 0:
+                    self.__cond.wait()
+                strict = self.__durability == Flusher.STRICT
+                interval = self.__interval
+            if not strict:
+                # 在间隔内继续收集请求
+                time.sleep(interval)
+
+            with self.__lock:
+                ops = self.__pending
+                self.__pending = []
+                batch = self.__batch
+                self.__batch += 1
+
+            self.__flush(ops)
+
+            with self.__lock:
+                self.__done = batch + 1
+                self.__batches += 1
+                self.__ops += len(ops)
+                self.__cond.notify_all()
+
+    def __flush(self, ops: List[FlushOp]):
+        # 同一个文件在一批中只 fsync 一次
+        synced = set()
+        dirs = set()
+        for op in ops:
+            target = op.tmp or op.path
+            try:
+                if target not in synced:
+                    fd = os.open(target, os.O_RDONLY)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+                    synced.add(target)
+                if len(op.tmp) != 0:
+                    os.replace(op.tmp, op.path)
+                    synced.discard(op.path)
+                dirs.add(os.path.dirname(os.path.abspath(op.path)))
+            except OSError as e:
+                print(f"fsync {target} 失败： {e}")
+                op.error = e
+        for d in dirs:
+            try:
+                fd = os.open(d, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                print(f"fsync {d} 失败： {e}")
+        with self.__lock:
+            self.__files += len(synced)
+
+
+flusher = Flusher()
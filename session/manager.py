@@ -1,21 +1,26 @@
-from dataclasses import asdict
-from datetime import datetime
 import json
 import os
+import threading
+import time
 
 from collections import OrderedDict
 from typing import List
 
 import error
+from config import SessionConfig, StorageConfig
 from memory import CurrentConversation, EnginePointer
 from rwlock import RWLock
 from schedule import Scheduler
-from session.session import Session
+from session.database import open_database
+from session.runtime import create_runtime
+from session.session import Session, SessionCounters
+from session.session.main_loop import pending
 from text import SessionText
 
 
 class SessionManager:
-    def __init__(self, text: str, database: str, scheduler: Scheduler):
+    def __init__(self, text: str, database: str, scheduler: Scheduler, storage: StorageConfig = StorageConfig(),
+                 session: SessionConfig = SessionConfig()):
         assert len(text) > 0
         assert len(database) > 0
 
@@ -24,6 +29,10 @@ class SessionManager:
         self.__text_path = text
         self.__database = database
         self.__scheduler = scheduler
+        self.__db = open_database(database, storage)
+        self.__config = session
+        self.__counters = SessionCounters()
+        self.__runtime = create_runtime(session, scheduler)
 
         self.__texts: OrderedDict[str, SessionText] = OrderedDict()
         self.__load_text()
@@ -31,6 +40,9 @@ class SessionManager:
         self.__sessions: OrderedDict[str, Session] = OrderedDict()
         self.__load_sessions()
 
+        if self.__config.hibernate_after > 0:
+            threading.Thread(target=self.__hibernate_loop, daemon=True).start()
+
     def __load_text(self):
         try:
             for type_ in os.listdir(self.__text_path):
@@ -48,22 +60,50 @@ class SessionManager:
         except OSError as e:
             raise error.InternalError(e)
 
+    # 只根据索引注册会话，会话在第一次访问时才加载
+    # 上次没有休眠的会话只读地检查一次，有未完成的工作时立即加载恢复，其余的记为休眠，下次启动不再检查
     def __load_sessions(self):
-        try:
-            for id_ in os.listdir(self.__database):
-                if id_.startswith("."):
-                    continue
-                session_path = os.path.join(self.__database, id_)
-                if not os.path.isdir(session_path):
+        for index in self.__db.list():
+            hydrate = False
+            if not index.get("hibernated", False):
+                try:
+                    storage = self.__db.storage(index)
+                    current = storage.current if storage.load(readonly=True) else None
+                    hydrate = pending(current)
+                    if not hydrate:
+                        index = {**index, "hibernated": True, "tokens": current.tokens}
+                        self.__db.save_index(index)
+                except (OSError, json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+                    print(e)
                     continue
+            s = Session(index, self.__texts, self.__scheduler, self.__db, self.__runtime, self.__counters)
+            if hydrate:
                 try:
-                    s = Session(session_path, self.__texts, self.__scheduler)
+                    s.hydrate()
                 except (FileNotFoundError, json.JSONDecodeError, KeyError, ValueError) as e:
                     print(e)
                     continue
-                self.__sessions[id_] = s
-        except OSError as e:
-            raise error.InternalError(e)
+            self.__sessions[index["id"]] = s
+
+    def __hibernate_loop(self):
+        while True:
+            time.sleep(self.__config.hibernate_check_interval)
+            for s in self.list():
+                try:
+                    s.hibernate(self.__config.hibernate_after)
+                except Exception as e:
+                    print(f"hibernate {s.asdict()['id']} failed: {e}")
+
+    def stats(self) -> dict:
+        sessions = self.list()
+        with self.__counters.lock:
+            return {
+                "total": len(sessions),
+                "hydrated": len([s for s in sessions if s.hydrated()]),
+                "hydrations": self.__counters.hydrations,
+                "hibernations": self.__counters.hibernations,
+                "runtime": self.__runtime.stats(),
+            }
 
     def list(self) -> List[Session]:
         self.__lock.acquire_read()
@@ -100,14 +140,14 @@ class SessionManager:
                         raise KeyError(f"invalid param: {key}: {params[key]}")
                 except KeyError:
                     raise error.InvalidParamError(f"invalid param: no key: {key}")
-            os.makedirs(os.path.join(self.__database, id_))
-            with open(os.path.join(self.__database, id_, "index.json"), 'w') as f:
-                f.write(json.dumps({
-                    "id": id_,
-                    "type": type_,
-                    "params": params,
-                }, ensure_ascii=False, indent=2))
-            s = Session(os.path.join(self.__database, id_), self.__texts, self.__scheduler)
+            index = {
+                "id": id_,
+                "type": type_,
+                "params": params,
+            }
+            self.__db.create(index)
+            s = Session(index, self.__texts, self.__scheduler, self.__db, self.__runtime, self.__counters)
+            s.hydrate()
             self.__sessions[id_] = s
             return s
         except FileExistsError:
@@ -142,13 +182,11 @@ class SessionManager:
                         raise KeyError(f"invalid param: {key}: {params[key]}")
                 except KeyError:
                     raise error.InvalidParamError(f"invalid param: no key: {key}")
-            os.makedirs(os.path.join(self.__database, id_))
-            with open(os.path.join(self.__database, id_, "index.json"), 'w') as f:
-                f.write(json.dumps({
-                    "id": id_,
-                    "type": type_,
-                    "params": params,
-                }, ensure_ascii=False, indent=2))
+            index = {
+                "id": id_,
+                "type": type_,
+                "params": params,
+            }
 
             # 生引导语
             guide = text.inherit(params, memo, history)
@@ -159,11 +197,10 @@ class SessionManager:
             current.pointer.level = level
             current.pointer.title = id_
             current.pointer.status = EnginePointer.UNINITIALIZED
-            current_str = json.dumps(asdict(current), ensure_ascii=False, indent=2)
-            with open(os.path.join(self.__database, id_, "current.json"), "w") as f:
-                f.write(current_str)
+            self.__db.create(index, current)
 
-            s = Session(os.path.join(self.__database, id_), self.__texts, self.__scheduler)
+            s = Session(index, self.__texts, self.__scheduler, self.__db, self.__runtime, self.__counters)
+            s.hydrate()
             self.__sessions[id_] = s
             return s
         except FileExistsError:
@@ -195,8 +232,7 @@ class SessionManager:
         try:
             self.__sessions[id_].exit()
             del self.__sessions[id_]
-            suffix = datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
-            os.rename(os.path.join(self.__database, id_), os.path.join(self.__database, f".{id_}.{suffix}"))
+            self.__db.remove(id_)
         except FileNotFoundError:
             raise error.InvalidParamError(f"no such session: {id_}")
         except OSError as e:
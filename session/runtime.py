@@ -0,0 +1,135 @@
+import heapq
+import itertools
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Tuple
+
+import error
+from config import SessionConfig
+from schedule import Scheduler
+
+
+# 每个会话一个主循环线程，命令在各自的工作线程中执行
+class ThreadRuntime:
+    name = "thread"
+
+    def __init__(self, config: SessionConfig, scheduler: Scheduler):
+        pass
+
+    def start(self, session):
+        session.worker.start()
+        session.main_loop_thread = threading.Thread(target=session.main_loop)
+        session.main_loop_thread.start()
+
+    # 主循环线程自己在 worker_cond 上等待命令
+    def wake(self, session):
+        pass
+
+    def stats(self) -> dict:
+        return {"name": ThreadRuntime.name}
+
+
+# 到时间后调用函数，所有等待共用一个线程
+class Delayer:
+    def __init__(self, name: str):
+        self.__cond = threading.Condition()
+        self.__heap: List[Tuple[float, int, Callable]] = []
+        self.__counter = itertools.count()  # 时间相同时按加入的顺序
+        threading.Thread(target=self.__loop, name=name, daemon=True).start()
+
+    def call_later(self, delay: float, fn: Callable):
+        with self.__cond:
+            heapq.heappush(self.__heap, (time.monotonic() + delay, next(self.__counter), fn))
+            self.__cond.notify()
+
+    def pending(self) -> int:
+        with self.__cond:
+            return len(self.__heap)
+
+    def __loop(self):
+        while True:
+            with self.__cond:
+                while len(self.__heap) == 0 or self.__heap[0][0] > time.monotonic():
+                    self.__cond.wait(None if len(self.__heap) == 0 else self.__heap[0][0] - time.monotonic())
+                _, _, fn = heapq.heappop(self.__heap)
+            try:
+                fn()
+            except Exception:
+                traceback.print_exc()
+
+
+# 所有会话的命令提交到一个有界的共享线程池中执行，命令需要等待时不占用线程，到时间后重新提交
+class PoolRuntime:
+    name = "pool"
+
+    def __init__(self, config: SessionConfig, scheduler: Scheduler):
+        self.__executor = ThreadPoolExecutor(max_workers=config.workers, thread_name_prefix="session")
+        self.__delayer = Delayer("session-delay")
+        self.__workers: int = config.workers
+        self.__lock = threading.Lock()
+        self.__queued: int = 0
+        self.__running: int = 0
+        self.__dispatched: int = 0
+
+    # 在调用者的线程中加载会话，有初始命令时由 prepare 唤醒
+    def start(self, session):
+        session.modules.main_loop.prepare(session)
+
+    # 设置命令之后调用，需要持有会话的 worker_lock
+    def wake(self, session):
+        if session.dispatching:
+            return  # 正在执行的 dispatch 结束时会取走新命令
+        session.dispatching = True
+        self.submit(session)
+
+    def submit(self, session):
+        with self.__lock:
+            self.__queued += 1
+        self.__executor.submit(self.__run, session)
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                "name": PoolRuntime.name,
+                "workers": self.__workers,
+                "queued": self.__queued,
+                "running": self.__running,
+                "waiting": self.__delayer.pending(),
+                "dispatched": self.__dispatched,
+            }
+
+    def __run(self, session):
+        with self.__lock:
+            self.__queued -= 1
+            self.__running += 1
+        try:
+            interval = session.modules.main_loop.dispatch(session)
+            if interval is None:
+                return
+            if interval == 0:
+                self.submit(session)  # 有新命令，重新排队，避免一个会话长期占用工作线程
+            else:
+                self.__delayer.call_later(interval, lambda: self.submit(session))
+        except Exception as e:
+            traceback.print_exc()
+            session.logger.error("dispatch failed: %s", str(e))
+            with session.worker_lock:
+                session.dispatching = False
+        finally:
+            with self.__lock:
+                self.__running -= 1
+                self.__dispatched += 1
+
+
+runtimes = {
+    ThreadRuntime.name: ThreadRuntime,
+    PoolRuntime.name: PoolRuntime,
+}
+
+
+def create_runtime(config: SessionConfig, scheduler: Scheduler):
+    if config.runtime not in runtimes:
+        raise error.InvalidParamError(f"no such session runtime: {config.runtime}")
+    return runtimes[config.runtime](config, scheduler)
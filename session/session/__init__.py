@@ -1,9 +1,12 @@
+import threading
+import time
 from collections import OrderedDict
 from dataclasses import dataclass
 from typing import List
 
 from memory import Message
 from schedule import Scheduler
+from session.session.feed import ReplySnapshot
 from session.session.internal import SessionInternal
 from text import SessionText
 
@@ -13,51 +16,161 @@ class SessionMessageResponse:
     mid: str
     msg: str
     end: bool
+    offset: int = 0  # msg 在完整回复中的起始位置
 
+    # 只保留 offset 之后的文本，offset 超出范围时返回完整的文本
+    def after(self, offset: int):
+        if offset <= 0 or offset > len(self.msg):
+            return self
+        return SessionMessageResponse(self.mid, self.msg[offset:], self.end, self.offset + offset)
 
+
+# 会话的加载与休眠次数
+class SessionCounters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hydrations: int = 0
+        self.hibernations: int = 0
+
+
+# 会话在第一次访问时才加载（hydrate），空闲一段时间后休眠（hibernate），休眠时停止线程并释放内存
 class Session:
-    def __init__(self, d: str, texts: OrderedDict[str, SessionText], scheduler: Scheduler):
-        self.__internal = SessionInternal(d, texts, scheduler)
+    def __init__(self, index: dict, texts: OrderedDict[str, SessionText], scheduler: Scheduler, database, runtime,
+                 counters: SessionCounters | None = None):
+        self.__index: dict = index
+        self.__texts: OrderedDict[str, SessionText] = texts
+        self.__scheduler: Scheduler = scheduler
+        self.__database = database
+        self.__runtime = runtime
+        self.__counters: SessionCounters = counters if counters is not None else SessionCounters()
+
+        self.__lock = threading.Lock()
+        self.__internal: SessionInternal | None = None
+        self.__using: int = 0  # 正在调用的请求数，不为 0 时不能休眠
+        self.__last_access: float = time.time()
+
+    def hydrated(self) -> bool:
+        return self.__internal is not None
+
+    def hydrate(self):
+        with self.__lock:
+            self.__hydrate()
+
+    # 空闲超过 idle 秒且没有待处理的工作时休眠，返回是否休眠了
+    def hibernate(self, idle: float) -> bool:
+        with self.__lock:
+            internal = self.__internal
+            if internal is None or self.__using != 0:
+                return False
+            if time.time() - self.__last_access < idle or not internal.quiescent():
+                return False
+            internal.exit()
+            internal.exited.wait()
+            self.__internal = None
+            _, tokens = internal.get_status()
+            self.__index = {
+                "id": internal.id,
+                "type": internal.type,
+                "params": internal.params,
+            }
+            with self.__counters.lock:
+                self.__counters.hibernations += 1
+            # 写入失败时索引中没有休眠标记，下次启动时会立即加载
+            self.__database.save_index({**self.__index, "hibernated": True, "tokens": tokens})
+            self.__index["hibernated"] = True
+            self.__index["tokens"] = tokens
+        return True
 
     def asdict(self) -> dict:
+        internal = self.__internal
+        if internal is None:
+            return {
+                "id": self.__index["id"],
+                "type": self.__index["type"],
+                "params": self.__index["params"],
+            }
         return {
-            "id": self.__internal.id,
-            "type": self.__internal.type,
-            "params": self.__internal.params,
+            "id": internal.id,
+            "type": internal.type,
+            "params": internal.params,
         }
 
     def exit(self):
-        return self.__internal.exit()
+        with self.__lock:
+            if self.__internal is None:
+                return
+            return self.__internal.exit()
 
     def reload(self):
-        return self.__internal.reload()
+        return self.__call(SessionInternal.reload)
 
     def set_params(self, params: dict):
-        return self.__internal.set_params(params)
+        return self.__call(SessionInternal.set_params, params)
 
     def status(self) -> (int, int):
-        return self.__internal.get_status()
+        with self.__lock:
+            if self.__internal is None:
+                # 休眠的会话总是空闲的，不需要为了查询状态而加载
+                return SessionInternal.IDLE, self.__index.get("tokens", 0)
+        return self.__call(SessionInternal.get_status)
 
     def force_compress(self):
-        return self.__internal.force_compress()
+        return self.__call(SessionInternal.force_compress)
 
     def send(self):
-        return self.__internal.send()
+        return self.__call(SessionInternal.send)
 
     def get(self, stop=False) -> SessionMessageResponse:
-        return self.__internal.get(stop)
+        return self.__call(SessionInternal.get, stop)
+
+    def reply_snapshot(self) -> ReplySnapshot:
+        return self.__call(SessionInternal.reply_snapshot)
+
+    # 等待正在生成的回复发生变化
+    def wait_reply(self, version: int, timeout: float) -> ReplySnapshot:
+        return self.__call(SessionInternal.wait_reply, version, timeout)
 
     def append_msg(self, msg: str, remark: dict):
-        return self.__internal.append_msg(msg, remark)
+        return self.__call(SessionInternal.append_msg, msg, remark)
 
     def memo(self) -> str:
-        return self.__internal.memo()
+        return self.__call(SessionInternal.memo)
 
     def history(self) -> List[Message]:
-        return self.__internal.history()
+        return self.__call(SessionInternal.history)
 
     def get_remark(self) -> dict:
-        return self.__internal.get_remark()
+        return self.__call(SessionInternal.get_remark)
 
     def set_remark(self, remark: dict):
-        return self.__internal.set_remark(remark)
+        return self.__call(SessionInternal.set_remark, remark)
+
+    def __hydrate(self) -> SessionInternal:
+        if self.__internal is not None:
+            return self.__internal
+        internal = SessionInternal(self.__index, self.__texts, self.__scheduler, self.__database, self.__runtime)
+        internal.ready.wait()  # 等待会话从储存中加载完毕
+        if self.__index.get("hibernated", False):
+            # 去掉休眠标记，异常退出后重启时会立即加载并恢复未完成的工作
+            self.__index = {
+                "id": internal.id,
+                "type": internal.type,
+                "params": internal.params,
+            }
+            self.__database.save_index(self.__index)
+        self.__internal = internal
+        with self.__counters.lock:
+            self.__counters.hydrations += 1
+        return internal
+
+    def __call(self, fn, *args):
+        with self.__lock:
+            internal = self.__hydrate()
+            self.__using += 1
+            self.__last_access = time.time()
+        try:
+            return fn(internal, *args)
+        finally:
+            with self.__lock:
+                self.__using -= 1
+                self.__last_access = time.time()
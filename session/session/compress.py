@@ -1,12 +1,11 @@
-import time
-
 import error
 from engine.openai_chat import OpenAIChatCompletion
 from engine.rev_chatgpt_web import RevChatGPTWeb
 from memory import EnginePointer
+from schedule.poll import poller
 from session.session.initialize import prune_memo
 from session.session.internal import SessionInternal
-from tokenizer import token_len
+from tokenizer import exceeds
 
 
 def force_compress(self):
@@ -25,7 +24,7 @@ def force_compress(self):
 
         self.command = SessionInternal.SUMMARIZE
         self.status = SessionInternal.INITIALIZING
-        self.worker_cond.notify_all()
+        self.notify_command()
 
 
 def summarize(self):
@@ -43,7 +42,7 @@ def summarize(self):
 
         self.command = SessionInternal.SUMMARIZE
         self.status = SessionInternal.INITIALIZING
-        self.worker_cond.notify_all()
+        self.notify_command()
 
 
 def merge(self: SessionInternal):
@@ -61,7 +60,7 @@ def merge(self: SessionInternal):
 
         self.command = SessionInternal.MERGE
         self.status = SessionInternal.INITIALIZING
-        self.worker_cond.notify_all()
+        self.notify_command()
 
 
 def clean(self: SessionInternal):
@@ -76,7 +75,7 @@ def clean(self: SessionInternal):
 
         self.command = SessionInternal.CLEAN
         self.status = SessionInternal.INITIALIZING
-        self.worker_cond.notify_all()
+        self.notify_command()
 
 
 def on_summarize(self: SessionInternal):
@@ -128,11 +127,13 @@ def on_summarize(self: SessionInternal):
             self.storage.save()
 
         # 循环等到 ChatGPT 回复完成
+        poll = poller.loop("summarize")
         while True:
             new_message = self.scheduler.get(self.storage.current.pointer)
+            interval = poll.next(len(new_message.msg))
             if new_message.end:
                 break
-            time.sleep(0.1)
+            yield interval
         reply = new_message.msg
 
     # 得到备忘录，确保备忘录格式正确
@@ -152,7 +153,7 @@ def on_summarize(self: SessionInternal):
             self.reading_num -= 1
             self.command = SessionInternal.CLEAN
             self.status = SessionInternal.INITIALIZING
-            self.worker_cond.notify_all()
+            self.notify_command()
         self.logger.info("on_summarize() leave")
         return
 
@@ -169,7 +170,7 @@ def on_summarize(self: SessionInternal):
         self.reading_num -= 1
         self.command = SessionInternal.MERGE
         self.status = SessionInternal.INITIALIZING
-        self.worker_cond.notify_all()
+        self.notify_command()
     self.logger.info("on_summarize() leave")
 
 
@@ -190,14 +191,18 @@ def on_merge(self: SessionInternal):
             )
         self.storage.save()
 
-    # 用一次性发送接口合并出备忘录
+    # 用一次性发送接口合并出备忘录，等待回复时不占用线程
     try:
-        reply = self.scheduler.send_away(self.storage.current.pointer.prompt, self.level)
+        future = self.scheduler.send_away_future(self.storage.current.pointer.prompt, self.level, "merge")
+        poll = poller.loop("merge")
+        while not future.done():
+            yield poll.next(0)
+        reply = future.result()
     except error.TooLarge:
         self.logger.error("on_merge() send too large. prune summary ...")
         summary = prune_memo(self.storage.current.pointer.summary)
         memo = self.storage.current.memo
-        if token_len(summary + self.storage.current.memo) > 1152:
+        if exceeds(summary + self.storage.current.memo, 1152):
             memo = prune_memo(self.storage.current.memo)
         with self.worker_lock:
             while self.writing or self.reading_num > 1:
@@ -208,7 +213,7 @@ def on_merge(self: SessionInternal):
             self.reading_num -= 1
             self.command = SessionInternal.MERGE
             self.status = SessionInternal.INITIALIZING
-            self.worker_cond.notify_all()
+            self.notify_command()
         self.logger.info("on_merge() leave")
         return
 
@@ -228,7 +233,7 @@ def on_merge(self: SessionInternal):
         self.reading_num -= 1
         self.command = SessionInternal.CLEAN
         self.status = SessionInternal.INITIALIZING
-        self.worker_cond.notify_all()
+        self.notify_command()
     self.logger.info("on_merge() leave")
 
 
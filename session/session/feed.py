@@ -0,0 +1,93 @@
+import threading
+import time
+from dataclasses import dataclass
+
+
+@dataclass
+class ReplySnapshot:
+    version: int
+    started: int  # 当前回复开始时的版本号
+    mid: str
+    msg: str
+    end: bool
+
+    # 读者在 since 版本时已经有了前 offset 个字符，返回新增部分的 offset 与文本
+    def delta(self, since: int, offset: int) -> (int, str):
+        if since < self.started or offset > len(self.msg):
+            return 0, self.msg
+        return offset, self.msg[offset:]
+
+
+# 会话正在生成的回复，由工作线程轮询后端时写入，所有读者共享，不再各自请求后端
+class ReplyFeed:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__cond = threading.Condition(self.__lock)
+        # 版本号从当前时间开始，会话休眠后重新加载时旧的游标不会大于新的版本号
+        self.__version: int = int(time.time() * 1000000)
+        self.__started: int = self.__version
+        self.__mid: str = ""
+        self.__msg: str = ""
+        self.__end: bool = True
+        self.__watchers: int = 0
+        self.__read: float = 0.0  # 最后一次被读取的时间
+
+    # 开始生成新的回复
+    def start(self, mid: str = ""):
+        with self.__lock:
+            self.__version += 1
+            self.__started = self.__version
+            self.__mid = mid
+            self.__msg = ""
+            self.__end = False
+            self.__cond.notify_all()
+
+    def publish(self, mid: str, msg: str, end: bool):
+        with self.__lock:
+            if mid == self.__mid and msg == self.__msg and end == self.__end:
+                return
+            self.__version += 1
+            if mid != self.__mid:
+                self.__started = self.__version
+            self.__mid = mid
+            self.__msg = msg
+            self.__end = end
+            self.__cond.notify_all()
+
+    # 生成中断时结束回复，避免读者一直等待
+    def finish(self):
+        with self.__lock:
+            if self.__end:
+                return
+            self.__version += 1
+            self.__end = True
+            self.__cond.notify_all()
+
+    def snapshot(self) -> ReplySnapshot:
+        with self.__lock:
+            self.__read = time.time()
+            return ReplySnapshot(self.__version, self.__started, self.__mid, self.__msg, self.__end)
+
+    # 等到版本号大于 version 或者超时，返回最新的状态
+    def wait(self, version: int, timeout: float) -> ReplySnapshot:
+        deadline = time.time() + timeout
+        with self.__lock:
+            self.__watchers += 1
+            try:
+                while self.__version <= version:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self.__cond.wait(remaining)
+            finally:
+                self.__watchers -= 1
+            return ReplySnapshot(self.__version, self.__started, self.__mid, self.__msg, self.__end)
+
+    def watchers(self) -> int:
+        with self.__lock:
+            return self.__watchers
+
+    def read_within(self, seconds: float) -> bool:
+        with self.__lock:
+            return time.time() - self.__read < seconds
+
@@ -1,11 +1,10 @@
-import time
-
 import error
 from engine.openai_chat import OpenAIChatCompletion
 from engine.rev_chatgpt_web import RevChatGPTWeb
 from memory import CurrentConversation, EnginePointer, Message
+from schedule.poll import poller
 from session.session.internal import SessionInternal
-from tokenizer import token_len
+from tokenizer import token_len, token_lens
 
 
 def create(self: SessionInternal):
@@ -31,7 +30,8 @@ def create(self: SessionInternal):
 
         self.command = SessionInternal.CREATE
         self.status = SessionInternal.INITIALIZING
-        self.worker_cond.notify_all()
+        self.feed.start()  # 读者从现在开始等待第一条回复
+        self.notify_command()
 
 
 def replace(self: SessionInternal):
@@ -65,7 +65,7 @@ def replace(self: SessionInternal):
         self.command = SessionInternal.INHERIT
         self.status = SessionInternal.INITIALIZING
         self.reading_num += 1
-        self.worker_cond.notify_all()
+        self.notify_command()
 
 
 def break_(self: SessionInternal):
@@ -104,7 +104,7 @@ def break_(self: SessionInternal):
         self.command = SessionInternal.BREAK
         self.status = SessionInternal.INITIALIZING
         self.reading_num += 1
-        self.worker_cond.notify_all()
+        self.notify_command()
 
 
 def inherit(self: SessionInternal):
@@ -121,14 +121,17 @@ def inherit(self: SessionInternal):
         self.command = SessionInternal.INHERIT
         self.status = SessionInternal.INITIALIZING
         self.reading_num += 1
-        self.worker_cond.notify_all()
+        self.notify_command()
 
 
 def prune_memo(memo: str) -> str:
     token_sum = token_len(memo)
     memo_lines = memo.splitlines()
-    memo_line_flags = [[False, index, token_len(memo_lines[index]) if memo_lines[index].startswith("- ") else 0]
-                       for index in range(len(memo_lines))]
+
+    # 一次性批量计算列表项行的 token 数
+    item_indexes = [index for index in range(len(memo_lines)) if memo_lines[index].startswith("- ")]
+    item_tokens = dict(zip(item_indexes, token_lens([memo_lines[index] for index in item_indexes])))
+    memo_line_flags = [[False, index, item_tokens.get(index, 0)] for index in range(len(memo_lines))]
 
     # 按 token 长度从大到小排序
     memo_line_flag_indexes = list(range(len(memo_line_flags)))
@@ -171,7 +174,7 @@ def on_inherit(self: SessionInternal):
             self.logger.error("on_inherit() send error: %s", err)
             self.storage.current.pointer.engine = ""
             self.storage.current.pointer.account = ""
-            time.sleep(1)
+            yield 1
         except error.TooLarge:
             self.logger.error("on_inherit() send too large. prune memo ...")
             memo = prune_memo(self.storage.current.memo)
@@ -203,11 +206,13 @@ def on_inherit(self: SessionInternal):
             self.storage.save()
 
         # 循环等到 ChatGPT 回复完成
+        poll = poller.loop("inherit", self.watched)
         while True:
             new_message = self.scheduler.get(self.storage.current.pointer)
+            interval = poll.next(len(new_message.msg))
             if new_message.end:
                 break
-            time.sleep(0.1)
+            yield interval
         new_tokens = token_len(new_message.msg)
 
         # 完成了继承，记录帐号以及 id 和 mid
@@ -234,7 +239,8 @@ def on_inherit(self: SessionInternal):
 
                 self.command = SessionInternal.SEND
                 self.status = SessionInternal.GENERATING
-                self.worker_cond.notify_all()
+                self.feed.start()  # 读者从现在开始等待恢复的消息的回复
+                self.notify_command()
                 self.logger.info("on_inherit() leave")
                 return
             self.storage.current.pointer.status = EnginePointer.IDLE
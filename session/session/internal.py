@@ -1,16 +1,15 @@
 import copy
 import importlib
-import json
 import logging
-import os
 import threading
 from collections import OrderedDict
 from dataclasses import dataclass
-from typing import List
+from typing import Generator, List
 
 import error
-from memory import Message
+from memory import EnginePointer, Message
 from schedule import Scheduler
+from session.session.feed import ReplyFeed, ReplySnapshot
 from session.storage import SessionStorage
 from text import SessionText
 
@@ -20,6 +19,13 @@ class SessionMessageResponse:
     mid: str
     msg: str
     end: bool
+    offset: int = 0  # msg 在完整回复中的起始位置
+
+    # 只保留 offset 之后的文本，offset 超出范围时返回完整的文本
+    def after(self, offset: int):
+        if offset <= 0 or offset > len(self.msg):
+            return self
+        return SessionMessageResponse(self.mid, self.msg[offset:], self.end, self.offset + offset)
 
 
 @dataclass
@@ -61,7 +67,7 @@ class SessionInternal:
     INITIALIZING = 2  # 初始化中（不可停止）
     STOPPING = 3  # 停止中
 
-    def __init__(self, d: str, texts: OrderedDict[str, SessionText], scheduler: Scheduler):
+    def __init__(self, index: dict, texts: OrderedDict[str, SessionText], scheduler: Scheduler, database, runtime):
         self.modules: SessionInternalModules = SessionInternalModules(
             importlib.import_module("session.session.main_loop"),
             importlib.import_module("session.session.initialize"),
@@ -69,22 +75,20 @@ class SessionInternal:
             importlib.import_module("session.session.compress"),
         )
 
-        self.d: str = d
+        self.database = database  # DirectoryDatabase 或 SQLiteDatabase
 
-        with open(os.path.join(d, "index.json"), "r") as f:
-            j = json.loads(f.read())
-        self.id: str = j["id"]
-        self.type: str = j["type"]
-        self.params: dict = j["params"]
+        self.id: str = index["id"]
+        self.type: str = index["type"]
+        self.params: dict = index["params"]
         self.level: int = int(self.params["level"])
 
         self.logger = logging.getLogger(self.id)
         self.texts: OrderedDict[str, SessionText] = texts
         self.scheduler: Scheduler = scheduler
-        self.storage: SessionStorage = SessionStorage(d, self.type, self.params)
-        self.main_loop: threading.Thread = threading.Thread(target=self.main_loop)
-        self.worker: threading.Thread = threading.Thread()  # 执行命令用的线程
-        self.worker.start()
+        self.storage: SessionStorage = database.storage(index)
+        self.runtime = runtime  # ThreadRuntime、 PoolRuntime 或 AsyncRuntime
+        self.main_loop_thread: threading.Thread | None = None  # 仅 ThreadRuntime
+        self.worker: threading.Thread = threading.Thread()  # 执行命令用的线程（仅 ThreadRuntime）
 
         self.status: int = SessionInternal.IDLE
         self.command: int = SessionInternal.NONE
@@ -92,8 +96,13 @@ class SessionInternal:
         self.writing = False
         self.worker_lock: threading.Lock = threading.Lock()
         self.worker_cond: threading.Condition = threading.Condition(self.worker_lock)
+        self.ready: threading.Event = threading.Event()  # 主循环从储存中加载完毕
+        self.exited: threading.Event = threading.Event()  # 已执行 EXIT 命令
+        self.feed: ReplyFeed = ReplyFeed()  # 正在生成的回复
+        self.dispatching: bool = False  # 仅 PoolRuntime 和 AsyncRuntime，是否已提交执行
+        self.flow: Generator | None = None  # 仅 PoolRuntime 和 AsyncRuntime，正在执行的命令的流程
 
-        self.main_loop.start()
+        self.runtime.start(self)
 
     def __del__(self):
         # TODO 终止所有线程
@@ -112,6 +121,25 @@ class SessionInternal:
             else:
                 return self.status, self.storage.current.tokens
 
+    # 空闲且没有待处理的工作，可以休眠
+    def quiescent(self) -> bool:
+        with self.worker_lock:
+            if self.status != SessionInternal.IDLE or self.command != SessionInternal.NONE:
+                return False
+            if self.reading_num != 0 or self.writing or self.worker.is_alive() or self.dispatching:
+                return False
+            current = self.storage.current
+            if current is None or current.pointer.status != EnginePointer.IDLE:
+                return False
+            if current.queue_message is not None or current.break_message is not None:
+                return False
+            return len(current.messages) == 0 or current.messages[-1].sender != Message.USER
+
+    # 设置命令之后调用（需要持有 worker_lock），唤醒主循环或者把会话提交到线程池
+    def notify_command(self):
+        self.worker_cond.notify_all()
+        self.runtime.wake(self)
+
     def main_loop(self):
         return self.modules.main_loop.main_loop(self)
 
@@ -168,6 +196,16 @@ class SessionInternal:
             else:
                 return self.storage.current.messages
 
+    # 最近有人在看正在生成的回复
+    def watched(self) -> bool:
+        return self.feed.watchers() != 0 or self.feed.read_within(2.0)
+
+    def reply_snapshot(self) -> ReplySnapshot:
+        return self.feed.snapshot()
+
+    def wait_reply(self, version: int, timeout: float) -> ReplySnapshot:
+        return self.feed.wait(version, timeout)
+
     def get_remark(self) -> dict:
         return self.storage.load_remark()
 
@@ -204,9 +242,8 @@ class SessionInternal:
             keys.append(key)
         self.params = new_params
 
-        with open(os.path.join(self.d, "index.json"), "w") as f:
-            f.write(json.dumps({
-                "id": self.id,
-                "type": self.type,
-                "params": self.params,
-            }))
+        self.database.save_index({
+            "id": self.id,
+            "type": self.type,
+            "params": self.params,
+        })
@@ -1,9 +1,10 @@
+import inspect
 import threading
 import time
 import traceback
-from typing import Callable
+from typing import Callable, Generator
 
-from memory import EnginePointer, Message
+from memory import CurrentConversation, EnginePointer, Message
 from session.session.internal import SessionInternal
 
 
@@ -17,7 +18,7 @@ def exit_(self: SessionInternal):
 
         self.command = SessionInternal.EXIT
         self.status = SessionInternal.INITIALIZING
-        self.worker_cond.notify_all()
+        self.notify_command()
 
 
 def reload(self: SessionInternal):
@@ -30,17 +31,17 @@ def reload(self: SessionInternal):
 
         self.command = SessionInternal.RELOAD
         self.status = SessionInternal.INITIALIZING
-        self.worker_cond.notify_all()
+        self.notify_command()
 
 
-def main_loop(self: SessionInternal):
-    while True:
-        self.status = SessionInternal.IDLE
-        self.command = SessionInternal.NONE
-        self.reading_num = 0
-        self.writing = False
+# 重置状态，并根据 storage 判断初始命令
+def prepare(self: SessionInternal):
+    self.status = SessionInternal.IDLE
+    self.command = SessionInternal.NONE
+    self.reading_num = 0
+    self.writing = False
 
-        # 根据 storage 判断初始命令
+    try:
         if not self.storage.load():
             self.create()  # 没有当前储存的会话，直接创建
         elif self.storage.current.pointer.status == EnginePointer.FULLED:
@@ -65,43 +66,116 @@ def main_loop(self: SessionInternal):
             if len(self.storage.current.messages) != 0:
                 if self.storage.current.messages[-1].sender == Message.USER:
                     self.send()
+    finally:
+        self.ready.set()  # 加载失败时也不能让等待加载的调用者一直阻塞
+
+
+# 储存中的会话是否有未完成的工作，与 prepare 给出初始命令的条件一致
+def pending(current: CurrentConversation | None) -> bool:
+    if current is None or current.pointer.status != EnginePointer.IDLE:
+        return True
+    if current.queue_message is not None or current.break_message is not None:
+        return True
+    return len(current.messages) != 0 and current.messages[-1].sender == Message.USER
+
+
+# 取出命令，block 为 False 时没有命令直接返回 NONE
+def take_command(self: SessionInternal, block: bool = True) -> int:
+    with self.worker_lock:
+        if self.command == SessionInternal.NONE:
+            if not block:
+                return SessionInternal.NONE
+            self.logger.info("waiting for command ...")
+        while self.command == SessionInternal.NONE:  # 等待新命令
+            self.worker_cond.wait()
+        command = self.command
+        self.logger.info("get command %s", SessionInternal.CMD_STR[command])
+        self.command = SessionInternal.NONE
+    return command
+
+
+def command_fn(self: SessionInternal, command: int) -> Callable:
+    cmd_map = {
+        SessionInternal.SEND: self.on_send,
+        SessionInternal.CREATE: self.on_send,
+        SessionInternal.SUMMARIZE: self.on_summarize,
+        SessionInternal.MERGE: self.on_merge,
+        SessionInternal.CLEAN: self.on_clean,
+        SessionInternal.INHERIT: self.on_inherit,
+        SessionInternal.BREAK: self.on_inherit,
+    }
+    fn = cmd_map.get(command)
+    assert fn is not None
+    return fn
+
+
+# 每个会话一个主循环线程，每个命令一个工作线程
+def main_loop(self: SessionInternal):
+    while True:
+        prepare(self)
 
-        cmd_map = {
-            SessionInternal.SEND: self.on_send,
-            SessionInternal.CREATE: self.on_send,
-            SessionInternal.SUMMARIZE: self.on_summarize,
-            SessionInternal.MERGE: self.on_merge,
-            SessionInternal.CLEAN: self.on_clean,
-            SessionInternal.INHERIT: self.on_inherit,
-            SessionInternal.BREAK: self.on_inherit,
-        }
         while True:  # 开始主循环
-            with self.worker_lock:
-                if self.command == SessionInternal.NONE:
-                    self.logger.info("waiting for command ...")
-                while self.command == SessionInternal.NONE:  # 等待新命令
-                    self.worker_cond.wait()
-                command = self.command
-                self.logger.info("get command %s", SessionInternal.CMD_STR[command])
-                self.command = SessionInternal.NONE
+            command = take_command(self)
             if command == SessionInternal.EXIT:
                 self.worker.join()  # 确保工作线程完全结束
+                self.exited.set()
                 return
             elif command == SessionInternal.RELOAD:
                 self.worker.join()  # 确保工作线程完全结束
                 break
-            fn = cmd_map.get(command)
-            assert fn is not None
+            fn = command_fn(self, command)
             self.worker.join()  # 确保工作线程完全结束
-            self.worker = threading.Thread(target=worker_fn, args=(self, fn))
+            self.worker = threading.Thread(target=run, args=(worker_fn(self, fn),))
             self.worker.start()  # 启动新线程执行命令
 
 
-def worker_fn(self: SessionInternal, fn: Callable):
+# 在当前线程中执行完命令的流程，需要等待时直接睡眠
+def run(flow: Generator):
+    for interval in flow:
+        time.sleep(interval)
+
+
+# 执行会话的一步，同一个会话同时只有一个 dispatch 在执行，保证命令的顺序
+# 没有正在执行的命令时取出新命令，执行到命令需要等待或者结束为止
+# 返回再次调用 dispatch 之前需要等待的秒数，没有工作时返回 None ，此时 dispatching 已经清除
+def dispatch(self: SessionInternal) -> float | None:
+    if self.flow is None:
+        command = take_command(self, False)
+        if command == SessionInternal.EXIT:
+            with self.worker_lock:
+                self.dispatching = False
+            self.exited.set()
+            return None
+        elif command == SessionInternal.RELOAD:
+            prepare(self)
+        elif command != SessionInternal.NONE:
+            self.flow = worker_fn(self, command_fn(self, command))
+
+    if self.flow is not None:
+        try:
+            return next(self.flow)
+        except StopIteration:
+            pass
+        except Exception:
+            pass  # worker_fn 已经记录了错误
+        self.flow = None
+
+    with self.worker_lock:
+        if self.command == SessionInternal.NONE:
+            self.dispatching = False
+            return None
+    # 执行过程中又有了新命令，重新排队，避免一个会话长期占用工作线程
+    return 0
+
+
+# 命令的流程，需要等待时 yield 等待的秒数，等待的方式由运行方式决定
+def worker_fn(self: SessionInternal, fn: Callable) -> Generator:
     # 重试 3 次执行 fn
     for i in range(3):
         try:
-            fn()
+            flow = fn()
+            if inspect.isgenerator(flow):  # 不需要等待的流程是普通函数
+                yield from flow
             return
         except Exception as e:
             # 打印堆栈信息
@@ -111,7 +185,8 @@ def worker_fn(self: SessionInternal, fn: Callable):
 
             if i == 2:
                 self.logger.error("worker thread exception exited.")
+                self.feed.finish()
                 raise e
 
-            time.sleep(1 << i)
+            yield 1 << i
             self.logger.error("worker thread retrying ...")
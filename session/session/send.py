@@ -1,11 +1,13 @@
 import copy
-import time
 from typing import List
 
 import error
 from engine.openai_chat import OpenAIChatCompletion
 from engine.rev_chatgpt_web import RevChatGPTWeb
 from memory import Message, EnginePointer
+from schedule.poll import poller
+from session.classifier import local_classifier
+from session.classify import classify_cache
 from session.session.internal import SessionInternal, SessionMessageResponse
 from tokenizer import token_len
 
@@ -29,16 +31,18 @@ def get(self: SessionInternal, stop=False) -> SessionMessageResponse:
             if not wait:
                 break
             self.worker_cond.wait()
+        # 只复制需要用到的部分，不复制整个会话
         status = self.status
-        current = copy.deepcopy(self.storage.current)
+        pending = self.storage.current.queue_message is not None or self.storage.current.break_message is not None
+        pointer = copy.copy(self.storage.current.pointer)
         messages: List[Message] = []
         is_new_created = len(self.storage.current.memo) == 0
         if len(self.storage.current.messages) != 0:
-            messages.append(copy.deepcopy(self.storage.current.messages[-1]))
+            messages.append(copy.copy(self.storage.current.messages[-1]))
 
-    if current.queue_message or current.break_message:
+    if pending:
         return SessionMessageResponse("", "", False)
-    if current.pointer.status > EnginePointer.IDLE:
+    if pointer.status > EnginePointer.IDLE:
         # 压缩中，直接返回最后 AI 回复的消息
         assert len(messages) != 0
         if messages[-1].sender == Message.AI:
@@ -50,20 +54,15 @@ def get(self: SessionInternal, stop=False) -> SessionMessageResponse:
         else:
             return SessionMessageResponse("", "", False)
 
-    if current.pointer.engine == RevChatGPTWeb.__name__:
+    if pointer.engine == RevChatGPTWeb.__name__:
         if status == SessionInternal.INITIALIZING:
             if is_new_created:
-                if len(current.pointer.new_mid) == 0:
+                if len(pointer.new_mid) == 0:
                     # 刚创建的会话
                     return SessionMessageResponse("", "", False)
                 else:
-                    # 刚创建的会话，且正在生成中
-                    new_message = self.scheduler.get(current.pointer)
-                    return SessionMessageResponse(
-                        new_message.mid,
-                        self.texts[self.type].extract_response(new_message.msg),
-                        new_message.end,
-                    )
+                    # 刚创建的会话，且正在生成中，读取工作线程发布的回复
+                    return reply_response(self)
             else:
                 # 继承中，直接返回最后 AI 回复的消息
                 assert messages[-1].sender == Message.AI
@@ -81,25 +80,15 @@ def get(self: SessionInternal, stop=False) -> SessionMessageResponse:
                 True,
             )
         if status == SessionInternal.GENERATING:
-            if len(current.pointer.new_mid) == 0:
+            if len(pointer.new_mid) == 0:
                 # 正在生成中，但是还没有生成出来
                 return SessionMessageResponse("", "", False)
             else:
-                try:
-                    new_message = self.scheduler.get(current.pointer)
-                except Exception as err:
-                    print(err)
-                    print(self.params)
-                    print(current.pointer)
-                    return SessionMessageResponse("", "", False)
-                return SessionMessageResponse(
-                    new_message.mid,
-                    self.texts[self.type].extract_response(new_message.msg),
-                    new_message.end,
-                )
+                # 读取工作线程发布的回复，还没有轮询到时当作还没有生成出来
+                return reply_response(self)
         assert False  # 未知状态
 
-    if current.pointer.status != EnginePointer.IDLE:
+    if pointer.status != EnginePointer.IDLE:
         if len(messages) == 0:
             return SessionMessageResponse("", "", False)
         assert messages[-1].sender == Message.AI
@@ -121,6 +110,14 @@ def get(self: SessionInternal, stop=False) -> SessionMessageResponse:
     return SessionMessageResponse("", "", False)
 
 
+# 工作线程发布的正在生成的回复，已经提取过
+def reply_response(self: SessionInternal) -> SessionMessageResponse:
+    snapshot = self.feed.snapshot()
+    if len(snapshot.mid) == 0:
+        return SessionMessageResponse("", "", False)
+    return SessionMessageResponse(snapshot.mid, snapshot.msg, snapshot.end)
+
+
 def append_msg(self: SessionInternal, msg: str, remark: dict):
     t_len = token_len(msg)
     if t_len > 1280:
@@ -133,8 +130,9 @@ def append_msg(self: SessionInternal, msg: str, remark: dict):
                     self.storage.current.messages[-1].sender == Message.USER:
                 raise error.NotAcceptable('session is busy')
             if self.status != SessionInternal.IDLE:
-                self.storage.current.queue_message = Message("", Message.USER, "", token_len(msg), remark)
+                self.storage.current.queue_message = Message("", Message.USER, "", t_len, remark, 0)
                 self.storage.current.queue_message.remark["raw"] = msg
+                self.feed.start()  # 读者从现在开始等待排队消息的回复
                 return
             if self.writeable():
                 break
@@ -144,7 +142,7 @@ def append_msg(self: SessionInternal, msg: str, remark: dict):
         assert self.storage.current is not None
         assert self.storage.current.pointer.status == EnginePointer.IDLE
 
-        message = Message("", Message.USER, "", token_len(msg), copy.deepcopy(remark))
+        message = Message("", Message.USER, "", t_len, copy.deepcopy(remark), 0)
         message.remark["raw"] = msg
         self.storage.current.append_message(message)  # 将要发送的消息追加到最后
         self.storage.current.pointer.new_mid = ""  # 清空新消息的ID
@@ -152,7 +150,8 @@ def append_msg(self: SessionInternal, msg: str, remark: dict):
 
         self.command = SessionInternal.SEND
         self.status = SessionInternal.GENERATING
-        self.worker_cond.notify_all()
+        self.feed.start()  # 读者从现在开始等待新的回复
+        self.notify_command()
 
 
 def send(self: SessionInternal):
@@ -169,9 +168,11 @@ def send(self: SessionInternal):
 
         self.command = SessionInternal.SEND
         self.status = SessionInternal.GENERATING
-        self.worker_cond.notify_all()
+        self.feed.start()  # 读者从现在开始等待新的回复
+        self.notify_command()
 
 
+# 命令的流程都是生成器，需要等待时 yield 等待的秒数，由运行方式决定如何等待
 def on_send(self: SessionInternal):
     self.logger.info("on_send() enter")
 
@@ -209,32 +210,66 @@ def on_send(self: SessionInternal):
                                 last_message.remark["classify"] = ""
                                 self.storage.save()
                         else:
+                            # 相同的消息之前分类过时直接使用缓存的结果，否则本地模型有把握时在本地分类
+                            raw = last_message.remark.get("raw", "")
+                            classify_result = classify_cache.get(self.type, raw)
+                            classify_local = False
+                            if classify_result is None:
+                                classify_result = local_classifier.classify(self.type, raw)
+                                classify_local = classify_result is not None
                             with self.worker_lock:
                                 while self.writing or self.reading_num > 1:
                                     self.worker_cond.wait()
                                 last_message.remark["classify_prompt"] = classify_prompt
+                                if classify_result is not None:
+                                    last_message.remark["classify"] = classify_result
+                                if classify_local:
+                                    last_message.remark["classify_local"] = True
                                 self.storage.save()
 
-                            # 开始分类
-                            classify_mid = self.scheduler.send(self.storage.current)
+                            text = self.texts[self.type]
+                            if classify_result is None and text.can_classify_batch():
+                                # 与同时到达的其他会话的消息合并为一次分类
+                                future = self.scheduler.classify(
+                                    self.type, self.level, last_message, text.classify_batch, text.parse_classify_batch)
+                                if future is not None:
+                                    poll = poller.loop("classify", self.watched)
+                                    while not future.done():
+                                        yield poll.next(0)
+                                    classify_result = future.result()
+                                if classify_result is not None:
+                                    with self.worker_lock:
+                                        while self.writing or self.reading_num > 1:
+                                            self.worker_cond.wait()
+                                        last_message.remark["classify"] = classify_result
+                                        self.storage.save()
+                                    classify_cache.put(self.type, raw, classify_result)
+
+                            if classify_result is None:
+                                # 开始分类
+                                classify_mid = self.scheduler.send(self.storage.current)
+
+                                # 循环等到 ChatGPT 回复完成
+                                stop_flag = False
+                                poll = poller.loop("classify", self.watched)
+                                while True:
+                                    new_message = self.scheduler.get_rev_chatgpt_web(classify_mid, stop_flag)
+                                    interval = poll.next(len(new_message.msg))
+                                    if new_message.end:
+                                        break
+                                    with self.worker_lock:
+                                        if self.status == SessionInternal.STOPPING:
+                                            stop_flag = True
+                                    yield interval
 
-                            # 循环等到 ChatGPT 回复完成
-                            stop_flag = False
-                            while True:
-                                new_message = self.scheduler.get_rev_chatgpt_web(classify_mid, stop_flag)
-                                if new_message.end:
-                                    break
                                 with self.worker_lock:
-                                    if self.status == SessionInternal.STOPPING:
-                                        stop_flag = True
-                                time.sleep(0.1)
-
-                            with self.worker_lock:
-                                while self.writing or self.reading_num > 1:
-                                    self.worker_cond.wait()
-                                last_message.remark["classify"] = new_message.msg
-                                last_message.remark["classify_mid"] = classify_mid
-                                self.storage.save()
+                                    while self.writing or self.reading_num > 1:
+                                        self.worker_cond.wait()
+                                    last_message.remark["classify"] = new_message.msg
+                                    last_message.remark["classify_mid"] = classify_mid
+                                    self.storage.save()
+                                if not stop_flag and len(new_message.msg) != 0:
+                                    classify_cache.put(self.type, raw, new_message.msg)
                             self.logger.info("on_send() classify: %s", last_message.remark["classify"])
 
                     # 编译消息，得到即将发给 AI 的消息
@@ -242,7 +277,7 @@ def on_send(self: SessionInternal):
                     with self.worker_lock:
                         while self.writing or self.reading_num > 1:
                             self.worker_cond.wait()
-                        last_message.content = compiled_content
+                        last_message.set_content(compiled_content)
                         self.storage.save()
 
             # 发送信息，得到新信息的 mid
@@ -254,13 +289,14 @@ def on_send(self: SessionInternal):
             self.storage.current.pointer.account = ""
 
             if self.storage.current.pointer.status == EnginePointer.UNINITIALIZED:
-                time.sleep(1)
+                yield 1
                 continue
 
             # 帐号问题导致消息记录需要丢弃
             with self.worker_lock:
                 self.status = SessionInternal.INITIALIZING
                 self.reading_num -= 1
+            self.feed.finish()
             self.break_()
             self.logger.info("on_send() leave")
             return
@@ -271,10 +307,12 @@ def on_send(self: SessionInternal):
             while self.writing or self.reading_num > 1:
                 self.worker_cond.wait()
             self.storage.current.pointer.ai_index = len(self.storage.current.messages)
-            self.storage.current.append_message(Message("", Message.AI, reply, token_len(reply), {}))
+            reply_tokens = token_len(reply)
+            self.storage.current.append_message(Message("", Message.AI, reply, reply_tokens, {}, reply_tokens))
             if self.storage.current.tokens >= 2048:
                 self.storage.current.pointer.status = EnginePointer.FULLED
             self.storage.save()
+        self.feed.publish("", reply, True)
     if self.storage.current.pointer.engine == RevChatGPTWeb.__name__:
         mid = reply
 
@@ -285,21 +323,26 @@ def on_send(self: SessionInternal):
             self.storage.current.pointer.ai_index = len(self.storage.current.messages)
             self.storage.current.pointer.new_mid = mid
             self.storage.save()
+        self.feed.publish(mid, "", False)
 
-        # 循环等到 ChatGPT 回复完成
+        # 循环等到 ChatGPT 回复完成，回复的内容发布给所有读者
         stop_flag = False
+        poll = poller.loop("send", self.watched)
         while True:
             new_message = self.scheduler.get(self.storage.current.pointer, stop_flag)
+            self.feed.publish(new_message.mid, self.texts[self.type].extract_response(new_message.msg), new_message.end)
+            interval = poll.next(len(new_message.msg))
             if new_message.end:
                 break
             with self.worker_lock:
                 if self.status == SessionInternal.STOPPING:
                     stop_flag = True
-            time.sleep(0.1)
+            yield interval
 
         # 将消息提取出来
         msg_str = self.texts[self.type].extract_response(new_message.msg)
-        message = Message(new_message.mid, Message.AI, msg_str, token_len(new_message.msg), {})
+        msg_tokens = token_len(msg_str)
+        message = Message(new_message.mid, Message.AI, msg_str, msg_tokens, {}, msg_tokens)
 
         # 将 ChatGPT 回复的消息加入到记录中
         with self.worker_lock:
@@ -320,7 +363,7 @@ def on_send(self: SessionInternal):
             self.reading_num -= 1
             self.command = SessionInternal.SUMMARIZE
             self.status = SessionInternal.INITIALIZING
-            self.worker_cond.notify_all()
+            self.notify_command()
         self.logger.info("on_send() leave")
         return
 
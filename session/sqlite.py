@@ -0,0 +1,279 @@
+import copy
+import json
+import sqlite3
+import threading
+from dataclasses import asdict
+from datetime import datetime
+from typing import List
+
+import error
+from config import StorageConfig
+from memory import CurrentConversation, Message
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    params TEXT NOT NULL,
+    hibernated INTEGER NOT NULL DEFAULT 0,
+    tokens INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS sessions_type ON sessions (type);
+CREATE TABLE IF NOT EXISTS current (
+    session TEXT PRIMARY KEY REFERENCES sessions (id) ON UPDATE CASCADE ON DELETE CASCADE,
+    conversation TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    session TEXT NOT NULL REFERENCES sessions (id) ON UPDATE CASCADE ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    PRIMARY KEY (session, idx)
+);
+CREATE TABLE IF NOT EXISTS remarks (
+    session TEXT PRIMARY KEY REFERENCES sessions (id) ON UPDATE CASCADE ON DELETE CASCADE,
+    remark TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS archives (
+    session TEXT NOT NULL REFERENCES sessions (id) ON UPDATE CASCADE ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    conversation TEXT NOT NULL,
+    PRIMARY KEY (session, name)
+);
+"""
+
+# 持久化级别对应的 synchronous 设置
+SYNCHRONOUS = {
+    "none": "OFF",
+    "interval": "NORMAL",
+    "strict": "FULL",
+}
+
+
+# current 表中保存除 messages 以外的字段
+def conversation_to_str(current: CurrentConversation) -> str:
+    d = asdict(current)
+    del d["messages"]
+    return json.dumps(d, ensure_ascii=False)
+
+
+def message_to_str(message: Message) -> str:
+    return json.dumps(asdict(message), ensure_ascii=False)
+
+
+# 所有会话保存在一个 WAL 模式的 SQLite 文件中
+class SQLiteDatabase:
+    def __init__(self, path: str, config: StorageConfig = StorageConfig()):
+        self.__config: StorageConfig = config
+        self.lock = threading.Lock()
+        try:
+            self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self.connection.execute("PRAGMA journal_mode = WAL")
+            self.connection.execute(f"PRAGMA synchronous = {SYNCHRONOUS.get(config.durability, 'FULL')}")
+            self.connection.execute("PRAGMA foreign_keys = ON")
+            self.connection.executescript(SCHEMA)
+            self.__upgrade()
+        except sqlite3.Error as e:
+            raise error.InternalError(e)
+
+    def list(self) -> List[dict]:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id, type, params, hibernated, tokens FROM sessions WHERE id NOT LIKE '.%' ORDER BY rowid"
+            ).fetchall()
+        result = []
+        for id_, type_, params, hibernated, tokens in rows:
+            try:
+                index = {"id": id_, "type": type_, "params": json.loads(params)}
+            except json.JSONDecodeError as e:
+                print(e)
+                continue
+            if hibernated:
+                index["hibernated"] = True
+                index["tokens"] = tokens
+            result.append(index)
+        return result
+
+    # 会话已存在时抛出 FileExistsError，与目录储存一致
+    # 导入时备注和归档（名称与内容）也在同一个事务中写入，任何一步失败都不会留下导入了一半的会话
+    def create(self, index: dict, current: CurrentConversation | None = None, remark: dict | None = None,
+               archives: List[tuple[str, str]] | None = None):
+        with self.lock:
+            try:
+                with self.transaction():
+                    self.connection.execute(
+                        "INSERT INTO sessions (id, type, params) VALUES (?, ?, ?)",
+                        (index["id"], index["type"], json.dumps(index["params"], ensure_ascii=False)))
+                    if current is not None:
+                        self.write_current(index["id"], current)
+                    if remark is not None:
+                        self.connection.execute(
+                            "INSERT INTO remarks (session, remark) VALUES (?, ?)",
+                            (index["id"], json.dumps(remark, ensure_ascii=False)))
+                    self.connection.executemany(
+                        "INSERT INTO archives (session, name, conversation) VALUES (?, ?, ?)",
+                        [(index["id"], name, conversation) for name, conversation in archives or []])
+            except sqlite3.IntegrityError:
+                raise FileExistsError(index["id"])
+
+    def save_index(self, index: dict):
+        with self.lock:
+            self.connection.execute(
+                "UPDATE sessions SET type = ?, params = ?, hibernated = ?, tokens = ? WHERE id = ?",
+                (index["type"], json.dumps(index["params"], ensure_ascii=False),
+                 int(index.get("hibernated", False)), index.get("tokens", 0), index["id"]))
+
+    # 删除的会话改名为隐藏的 id 保留
+    def remove(self, id_: str):
+        suffix = datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
+        with self.lock:
+            cursor = self.connection.execute("UPDATE sessions SET id = ? WHERE id = ?", (f".{id_}.{suffix}", id_))
+        if cursor.rowcount == 0:
+            raise FileNotFoundError(id_)
+
+    def add_archive(self, id_: str, name: str, conversation: str):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO archives (session, name, conversation) VALUES (?, ?, ?)",
+                (id_, name, conversation))
+
+    def storage(self, index: dict):
+        return SQLiteSessionStorage(self, index["id"], index["type"], index["params"], self.__config)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    # 给旧版本创建的数据库补上新增的列
+    def __upgrade(self):
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(sessions)")]
+        if "hibernated" not in columns:
+            self.connection.execute("ALTER TABLE sessions ADD COLUMN hibernated INTEGER NOT NULL DEFAULT 0")
+        if "tokens" not in columns:
+            self.connection.execute("ALTER TABLE sessions ADD COLUMN tokens INTEGER NOT NULL DEFAULT 0")
+
+    def transaction(self):
+        return Transaction(self.connection)
+
+    # 以下方法需要在持有 lock 时调用
+    def write_current(self, id_: str, current: CurrentConversation):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO current (session, conversation) VALUES (?, ?)",
+            (id_, conversation_to_str(current)))
+        self.write_messages(id_, 0, current.messages)
+
+    def write_messages(self, id_: str, index: int, messages: List[Message]):
+        self.connection.execute("DELETE FROM messages WHERE session = ? AND idx >= ?", (id_, index))
+        self.connection.executemany(
+            "INSERT INTO messages (session, idx, message) VALUES (?, ?, ?)",
+            [(id_, index + i, message_to_str(messages[i])) for i in range(len(messages))])
+
+
+class Transaction:
+    def __init__(self, connection: sqlite3.Connection):
+        self.__connection = connection
+
+    def __enter__(self):
+        self.__connection.execute("BEGIN")
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.__connection.execute("COMMIT")
+        else:
+            self.__connection.execute("ROLLBACK")
+
+
+class SQLiteSessionStorage:
+    def __init__(self, database: SQLiteDatabase, id_: str, type_: str, params: dict,
+                 config: StorageConfig = StorageConfig()):
+        self.__database: SQLiteDatabase = database
+        self.__id: str = id_
+        self.__session_type: str = type_
+        self.__params: dict = params
+        self.__config: StorageConfig = config
+        self.current: CurrentConversation | None = None
+
+        # 上一次写入数据库时的状态，只写入变更的行
+        self.__saved_current: CurrentConversation | None = None
+        self.__saved_conversation: str = ""
+        self.__saved_messages: List[Message] = []
+
+    # 读取不会修改数据库， readonly 只是与 SessionStorage 保持一致
+    def load(self, readonly: bool = False) -> bool:
+        database = self.__database
+        with database.lock:
+            row = database.connection.execute(
+                "SELECT conversation FROM current WHERE session = ?", (self.__id,)).fetchone()
+            if row is None:
+                return False
+            rows = database.connection.execute(
+                "SELECT message FROM messages WHERE session = ? ORDER BY idx", (self.__id,)).fetchall()
+        d = json.loads(row[0])
+        d["messages"] = [json.loads(message) for message, in rows]
+        self.current = CurrentConversation.from_dict(d)
+        self.__snapshot()
+        return True
+
+    def save(self):
+        assert self.current is not None
+        database = self.__database
+        conversation = conversation_to_str(self.current)
+        with database.lock:
+            with database.transaction():
+                if self.current is not self.__saved_current:
+                    database.write_current(self.__id, self.current)
+                else:
+                    if conversation != self.__saved_conversation:
+                        database.connection.execute(
+                            "UPDATE current SET conversation = ? WHERE session = ?", (conversation, self.__id))
+                    index = self.__common_prefix()
+                    if index < len(self.current.messages) or index < len(self.__saved_messages):
+                        database.write_messages(self.__id, index, self.current.messages[index:])
+        self.__snapshot()
+
+    def replace(self, current: CurrentConversation):
+        assert self.current is not None
+        current_str = json.dumps(asdict(self.current), ensure_ascii=False)
+        archive_name = datetime.now().strftime("%Y-%m-%d-%H-%M-%S") + ".json"
+        self.__database.add_archive(self.__id, archive_name, current_str)
+
+        self.current = current
+        self.save()
+
+    # 按时间顺序读取 replace 时归档的会话
+    def load_archives(self) -> List[CurrentConversation]:
+        database = self.__database
+        with database.lock:
+            rows = database.connection.execute(
+                "SELECT conversation FROM archives WHERE session = ? ORDER BY name", (self.__id,)).fetchall()
+        return [CurrentConversation.from_dict(json.loads(conversation)) for conversation, in rows]
+
+    def load_remark(self) -> dict:
+        database = self.__database
+        with database.lock:
+            row = database.connection.execute(
+                "SELECT remark FROM remarks WHERE session = ?", (self.__id,)).fetchone()
+        if row is None:
+            return {}
+        return json.loads(row[0])
+
+    def save_remark(self, remark: dict):
+        remark_str = json.dumps(remark, ensure_ascii=False)
+        database = self.__database
+        with database.lock:
+            database.connection.execute(
+                "INSERT OR REPLACE INTO remarks (session, remark) VALUES (?, ?)", (self.__id, remark_str))
+
+    def __common_prefix(self) -> int:
+        messages = self.current.messages
+        index = 0
+        while index < len(messages) and index < len(self.__saved_messages) and \
+                messages[index] == self.__saved_messages[index]:
+            index += 1
+        return index
+
+    # 记录当前状态为已写入数据库的状态
+    def __snapshot(self):
+        self.__saved_current = self.current
+        self.__saved_conversation = conversation_to_str(self.current)
+        index = self.__common_prefix()
+        self.__saved_messages = self.__saved_messages[:index] + copy.deepcopy(self.current.messages[index:])
@@ -1,45 +1,118 @@
+import copy
+import hashlib
 import json
 import os.path
 from dataclasses import asdict
 from datetime import datetime
+from typing import List
 
-from memory import CurrentConversation
+from config import StorageConfig
+from memory import CurrentConversation, Message
+from session.flush import flusher
+
+# 会话中除了 messages 和 pointer 以外需要记录变更的字段
+CONVERSATION_FIELDS = ("guide", "memo", "recent_history", "tokens", "break_message", "queue_message")
+
+
+def message_to_dict(message: Message | None) -> dict | None:
+    if message is None:
+        return None
+    return asdict(message)
+
+
+def message_from_dict(d: dict | None) -> Message | None:
+    if d is None:
+        return None
+    return Message(**d)
 
 
 class SessionStorage:
-    def __init__(self, d: str, type_: str, params: dict):
+    SNAPSHOT = "snapshot"
+    JOURNAL = "journal"
+
+    def __init__(self, d: str, type_: str, params: dict, config: StorageConfig = StorageConfig()):
         self.__path: str = d
         self.__session_type: str = type_
         self.__params: dict = params
+        self.__config: StorageConfig = config
         self.current: CurrentConversation | None = None
 
-    def load(self) -> bool:
+        # 上一次写入磁盘时的状态，用于计算变更记录
+        self.__saved_current: CurrentConversation | None = None
+        self.__saved_messages: List[Message] = []
+        self.__saved_pointer: dict = {}
+        self.__saved_fields: dict = {}
+
+        # 当前检查点（current.json）的摘要，以及检查点之后追加的记录数
+        self.__checkpoint_digest: str = ""
+        self.__journal_records: int = 0
+
+    # readonly 为 True 时只在内存中重放日志，不修复损坏的日志，也不会写入磁盘，用于离线工具读取
+    def load(self, readonly: bool = False) -> bool:
         try:
-            with open(os.path.join(self.__path, "current.json"), "r") as f:
-                current_str = f.read()
+            with open(os.path.join(self.__path, "current.json"), "rb") as f:
+                current_bytes = f.read()
         except FileNotFoundError:
             return False
-        self.current = CurrentConversation.from_dict(json.loads(current_str))
+        self.current = CurrentConversation.from_dict(json.loads(current_bytes))
+        self.__checkpoint_digest = hashlib.blake2b(current_bytes, digest_size=16).hexdigest()
+        self.__journal_records = 0
+
+        # 重放检查点之后的变更记录
+        valid, torn = self.__replay()
+        if readonly:
+            return True
+        if self.__config.mode == SessionStorage.JOURNAL:
+            if not valid:
+                self.__checkpoint_digest = ""  # 没有可以追加的日志，下次保存时写检查点
+            self.__snapshot()
+        if torn:
+            # 日志尾部不完整，重写检查点，避免后续记录追加在损坏的行之后
+            self.__checkpoint()
         return True
 
     def save(self):
         assert self.current is not None
-        current_str = json.dumps(asdict(self.current), ensure_ascii=False, indent=2)
-        with open(os.path.join(self.__path, "current.json"), "w") as f:
-            f.write(current_str)
-        os.sync()
+        if self.__config.mode != SessionStorage.JOURNAL:
+            self.__checkpoint()
+            return
+        if self.current is not self.__saved_current or len(self.__checkpoint_digest) == 0:
+            self.__checkpoint()
+            return
+
+        records = self.__diff()
+        if len(records) == 0:
+            return
+        journal_str = "".join(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n" for record in records)
+        flusher.append(os.path.join(self.__path, "journal.jsonl"), journal_str.encode('utf-8'))
+        self.__journal_records += len(records)
+        self.__snapshot()
+        if self.__journal_records >= self.__config.checkpoint_interval:
+            self.__checkpoint()
 
     def replace(self, current: CurrentConversation):
         os.makedirs(os.path.join(self.__path, "archive"), exist_ok=True)
         assert self.current is not None
         current_str = json.dumps(asdict(self.current), ensure_ascii=False, indent=2)
         archive_name = datetime.now().strftime("%Y-%m-%d-%H-%M-%S") + ".json"
-        with open(os.path.join(self.__path, "archive", archive_name), "w") as f:
-            f.write(current_str)
+        flusher.write(os.path.join(self.__path, "archive", archive_name), current_str.encode('utf-8'))
 
         self.current = current
         self.save()
 
+    # 按时间顺序读取 replace 时归档的会话
+    def load_archives(self) -> List[CurrentConversation]:
+        archive_path = os.path.join(self.__path, "archive")
+        if not os.path.isdir(archive_path):
+            return []
+        archives = []
+        for name in sorted(os.listdir(archive_path)):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(archive_path, name), "rb") as f:
+                archives.append(CurrentConversation.from_dict(json.loads(f.read())))
+        return archives
+
     def load_remark(self) -> dict:
         try:
             with open(os.path.join(self.__path, "remark.json"), "r") as f:
@@ -50,5 +123,112 @@ class SessionStorage:
 
     def save_remark(self, remark: dict):
         remark_str = json.dumps(remark, ensure_ascii=False, indent=2)
-        with open(os.path.join(self.__path, "remark.json"), "w") as f:
-            f.write(remark_str)
+        flusher.write(os.path.join(self.__path, "remark.json"), remark_str.encode('utf-8'))
+
+    # 写入完整的 current.json 作为检查点，并开始新的日志
+    def __checkpoint(self):
+        current_bytes = json.dumps(asdict(self.current), ensure_ascii=False, indent=2).encode('utf-8')
+        flusher.write(os.path.join(self.__path, "current.json"), current_bytes)
+        if self.__config.mode == SessionStorage.JOURNAL:
+            # 日志第一行记录它所依赖的检查点，检查点不匹配的日志在加载时被忽略
+            self.__checkpoint_digest = hashlib.blake2b(current_bytes, digest_size=16).hexdigest()
+            self.__journal_records = 0
+            header_str = json.dumps({"op": "checkpoint", "digest": self.__checkpoint_digest}) + "\n"
+            flusher.write(os.path.join(self.__path, "journal.jsonl"), header_str.encode('utf-8'))
+            self.__snapshot()
+
+    # 返回日志是否属于当前检查点，以及日志尾部是否有不完整的记录
+    def __replay(self) -> (bool, bool):
+        try:
+            with open(os.path.join(self.__path, "journal.jsonl"), "r") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return False, False
+        if len(lines) == 0:
+            return False, False
+        try:
+            header = json.loads(lines[0])
+        except json.JSONDecodeError:
+            return False, True
+        if header.get("op") != "checkpoint" or header.get("digest") != self.__checkpoint_digest:
+            return False, False
+
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                return True, True
+            self.__apply(record)
+            self.__journal_records += 1
+        return True, False
+
+    def __apply(self, record: dict):
+        if record["op"] == "messages":
+            messages = [Message(**message) for message in record["messages"]]
+            self.current.messages[record["index"]:] = messages
+        elif record["op"] == "pointer":
+            for key in record["fields"]:
+                setattr(self.current.pointer, key, record["fields"][key])
+        elif record["op"] == "conversation":
+            for key in record["fields"]:
+                value = record["fields"][key]
+                if key not in CONVERSATION_FIELDS:
+                    continue  # 旧版本记录的字段，已不再使用
+                if key in ("break_message", "queue_message"):
+                    value = message_from_dict(value)
+                setattr(self.current, key, value)
+
+    # 对比上次写入磁盘时的状态，得到变更记录
+    def __diff(self) -> List[dict]:
+        records = []
+
+        messages = self.current.messages
+        index = 0
+        while index < len(messages) and index < len(self.__saved_messages) and \
+                messages[index] == self.__saved_messages[index]:
+            index += 1
+        if index < len(messages) or index < len(self.__saved_messages):
+            records.append({
+                "op": "messages",
+                "index": index,
+                "messages": [asdict(message) for message in messages[index:]],
+            })
+
+        pointer = asdict(self.current.pointer)
+        fields = {}
+        for key in pointer:
+            if pointer[key] != self.__saved_pointer.get(key):
+                fields[key] = pointer[key]
+        if len(fields) != 0:
+            records.append({"op": "pointer", "fields": fields})
+
+        fields = {}
+        for key in CONVERSATION_FIELDS:
+            value = getattr(self.current, key)
+            if isinstance(value, Message):
+                value = message_to_dict(value)
+            if value != self.__saved_fields.get(key):
+                fields[key] = value
+        if len(fields) != 0:
+            records.append({"op": "conversation", "fields": fields})
+
+        return records
+
+    # 记录当前状态为已写入磁盘的状态
+    def __snapshot(self):
+        self.__saved_current = self.current
+        if self.current is None:
+            return
+        messages = self.current.messages
+        index = 0
+        while index < len(messages) and index < len(self.__saved_messages) and \
+                messages[index] == self.__saved_messages[index]:
+            index += 1
+        self.__saved_messages = self.__saved_messages[:index] + copy.deepcopy(messages[index:])
+        self.__saved_pointer = asdict(self.current.pointer)
+        self.__saved_fields = {}
+        for key in CONVERSATION_FIELDS:
+            value = getattr(self.current, key)
+            if isinstance(value, Message):
+                value = message_to_dict(value)
+            self.__saved_fields[key] = value
@@ -1,6 +1,7 @@
 import importlib
 import json
 import os
+import re
 from copy import deepcopy
 from typing import List, Any
 import importlib.util
@@ -8,6 +9,40 @@ import importlib.util
 import error
 from memory import Message
 
+# 合并分类的提示词中可能被当作分隔符或者分类结果的行，从用户消息中去掉，避免一条消息伪造其他消息的结果
+BATCH_INJECTION = re.compile(r'^\s*(-{3,}|`{3,}|\d+\W*Classification\b)', re.IGNORECASE)
+BATCH_RESULT = re.compile(r'^\s*(\d+)\.\s*Classification:\s*([A-Q])', re.MULTILINE)
+
+
+# 把多条消息编号后合并为一次分类， options 为规则中的分类选项，供规则的 classify_batch 使用
+def build_classify_batch(messages: List[Message], options: str) -> str:
+    prompt = f'''The following are {len(messages)} requests inputted to ChatGPT by humans, numbered from 1 to {len(messages)}. Please categorize the content of each request and select the category that best fits.
+
+'''
+    for i, message in enumerate(messages):
+        raw = "\n".join(line for line in message.remark["raw"].splitlines() if not BATCH_INJECTION.match(line))
+        prompt += f"------ Request {i + 1} ------\n" + raw + "\n"
+    prompt += '''------
+
+Options:
+''' + options + '''
+Please output one line for each request in the same order, without any other content, in the following format:
+```
+1. Classification: X
+2. Classification: X
+'''
+    return prompt
+
+
+# 解析合并分类的回复，返回每条消息的分类结果，没有找到的为空字符串，所有规则共用
+def parse_classify_batch(reply: str, count: int) -> List[str]:
+    results = [""] * count
+    for match in BATCH_RESULT.finditer(reply):
+        index = int(match.group(1)) - 1
+        if 0 <= index < count and len(results[index]) == 0:
+            results[index] = "Classification: " + match.group(2)
+    return results
+
 
 class SessionText:
     def __init__(self, d: str):
@@ -88,6 +123,16 @@ class SessionText:
     def classify_message(self, message: Message) -> str:
         return self.rule.classify_message(deepcopy(message))
 
+    # 规则是否支持合并多条消息分类
+    def can_classify_batch(self) -> bool:
+        return hasattr(self.rule, "classify_batch")
+
+    def classify_batch(self, messages: List[Message]) -> str:
+        return self.rule.classify_batch(deepcopy(messages))
+
+    def parse_classify_batch(self, reply: str, count: int) -> List[str]:
+        return parse_classify_batch(reply, count)
+
     def compile_message(self, message: Message) -> str:
         return self.rule.compile_message(deepcopy(message))
 
@@ -3,8 +3,9 @@ import re
 from typing import List
 
 from memory import Message
+from text import build_classify_batch
 
-from tokenizer import token_len
+from tokenizer import token_lens, exceeds
 
 
 def get_raw_message(message: Message) -> str:
@@ -13,9 +14,9 @@ def get_raw_message(message: Message) -> str:
     return message.content
 
 
-# 精简消息，如果消息的 token 大于 384，则把第100个字符到倒数100个字符之间的内容替换为省略号
+# 精简消息，如果消息的 token 大于 384（使用已保存的 tokens），则把第100个字符到倒数100个字符之间的内容替换为省略号
 def prune_message(message: Message) -> str:
-    if token_len(message.content) <= 384:
+    if message.tokens <= 384:
         return message.content
     return message.content[:100] + '...' + message.content[-100:]
 
@@ -32,30 +33,37 @@ def compile_history(messages: List[Message], params: dict) -> (str, List[Message
 
     origin_messages = copy.deepcopy(messages)
 
-    for i in range(len(messages)):
-        messages[i].content = get_raw_message(messages[i])
-        messages[i].tokens = token_len(messages[i].content)
+    # 原始消息的 token 数已经保存在 tokens 中，无需重新计算
+    for message in messages:
+        message.content = get_raw_message(message)
+
+    # 预先精简每条消息，只有被精简的消息需要一次性批量重新计算 token 数
+    pruned_contents = [prune_message(message) for message in messages]
+    pruned_tokens = [message.tokens for message in messages]
+    pruned_indexes = [index for index in range(len(messages)) if pruned_contents[index] != messages[index].content]
+    for index, tokens in zip(pruned_indexes, token_lens([pruned_contents[index] for index in pruned_indexes])):
+        pruned_tokens[index] = tokens
 
     i = len(messages) - 2
 
     # 最后两条消息，如果 token 数超过 512，则精简消息，优先精简用户的消息
     token = messages[i].tokens + messages[i + 1].tokens + 2
     if token > 512:
-        messages[i].content = prune_message(messages[i])
-        messages[i].tokens = token_len(messages[i].content)
+        messages[i].content = pruned_contents[i]
+        messages[i].tokens = pruned_tokens[i]
         token = messages[i].tokens + messages[i + 1].tokens + 2
         if token > 512:
-            messages[i + 1].content = prune_message(messages[i + 1])
-            messages[i + 1].tokens = token_len(messages[i + 1].content)
+            messages[i + 1].content = pruned_contents[i + 1]
+            messages[i + 1].tokens = pruned_tokens[i + 1]
             token = messages[i + 1].tokens + messages[i].tokens + 2
     i -= 2
 
     # 每两条消息为一组，精简消息，计算 token 数，如果 token 数超过 1024，则停止
     while i >= 0:
-        messages[i + 1].content = prune_message(messages[i + 1])
-        messages[i + 1].tokens = token_len(messages[i + 1].content)
-        messages[i].content = prune_message(messages[i])
-        messages[i].tokens = token_len(messages[i].content)
+        messages[i + 1].content = pruned_contents[i + 1]
+        messages[i + 1].tokens = pruned_tokens[i + 1]
+        messages[i].content = pruned_contents[i]
+        messages[i].tokens = pruned_tokens[i]
         token += messages[i + 1].tokens + messages[i].tokens + 2
         if token > 512:
             break
@@ -93,23 +101,8 @@ O. 无法分类（例如无法理解话题的含义）；
 '''
 
 
-# 分类消息
-def classify_message(message: Message) -> str:
-    prompt = message.remark["raw"] + '''
-
-------
-The preceding is a request inputted to ChatGPT by me as a human. Please categorize its content and select the category that best fits.
-
-Options:'''
-    if token_len(message.content) > 1024:
-        prompt += message.remark["raw"] + '''
-A. Sensitive Topics in China (Including politics, political science, political system, government system, social system, social form, Marxism, ideology, modern Chinese history, Internet censorship circumvention, VPN technology or software，network accelerator, etc.; excluding ethics and morality, gender and sexual orientation, social responsibility);
-B. Inappropriate topics (pornography, illegal);
-L. Other topics;
-'''
-    else:
-        prompt += message.remark["raw"] + '''
-A. Sensitive Topics in China (Including politics, political science, political system, government system, social system, social form, Marxism, ideology, modern Chinese history, Internet censorship circumvention, VPN technology or software，network accelerator, etc.; excluding ethics and morality, gender and sexual orientation, social responsibility);
+# 分类的选项
+classify_options = '''A. Sensitive Topics in China (Including politics, political science, political system, government system, social system, social form, Marxism, ideology, modern Chinese history, Internet censorship circumvention, VPN technology or software，network accelerator, etc.; excluding ethics and morality, gender and sexual orientation, social responsibility);
 B. Inappropriate topics (pornography, illegal);
 C. Want to know about this AI (including name, age, feature, characteristics, abilities, personality, etc.)
 D. Inappropriate topics (disrespectful, impolite, lacks tact);
@@ -128,6 +121,24 @@ P. Other small talk topics not related to the AI (such as weather, etc);
 Q. Unable to classify (such as not understanding the meaning of the topic).
 '''
 
+
+# 分类消息
+def classify_message(message: Message) -> str:
+    prompt = message.remark["raw"] + '''
+
+------
+The preceding is a request inputted to ChatGPT by me as a human. Please categorize its content and select the category that best fits.
+
+Options:'''
+    if exceeds(message.content, 1024):
+        prompt += message.remark["raw"] + '''
+A. Sensitive Topics in China (Including politics, political science, political system, government system, social system, social form, Marxism, ideology, modern Chinese history, Internet censorship circumvention, VPN technology or software，network accelerator, etc.; excluding ethics and morality, gender and sexual orientation, social responsibility);
+B. Inappropriate topics (pornography, illegal);
+L. Other topics;
+'''
+    else:
+        prompt += message.remark["raw"] + '\n' + classify_options
+
     if len(message.remark["raw"]) > 96:
         prompt += '''
 Please output in the following format:
@@ -145,6 +156,11 @@ Classification: X
     return prompt
 
 
+# 把多条消息编号后合并为一次分类
+def classify_batch(messages: List[Message]) -> str:
+    return build_classify_batch(messages, classify_options)
+
+
 classify_tip_map = {
     'A': '（请注意该类话题在中国属于敏感话题，严重违反法律，请30字以内拒绝）',
     'B': '（话题走向不适当，请30字以内拒绝）',
@@ -1,22 +1,314 @@
+import glob
+import hashlib
+import math
 import os
+import re
 import threading
-from typing import Any
+from collections import OrderedDict
+from typing import Any, List, Dict, Tuple
 
-tokenizer: Any | None = None
+import error
+from config import TokenizerConfig
 
+try:
+    import regex
+except ImportError:
+    regex = None
 
-def __tokenizer_initialize():
-    os.environ['TRANSFORMERS_OFFLINE'] = '1'
-    from transformers import GPT2TokenizerFast
-    global tokenizer
-    tokenizer = GPT2TokenizerFast.from_pretrained("gpt2")
+# gpt2 的预分词规则，没有 regex 模块时用 re 近似
+if regex is not None:
+    pattern = regex.compile(r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""")
+else:
+    pattern = re.compile(r"""'s|'t|'re|'ve|'m|'ll|'d| ?[^\W\d_]+| ?\d+| ?(?:[^\s\w]|_)+|\s+(?!\S)|\s+""")
 
 
-__tokenizer_thread = threading.Thread(target=__tokenizer_initialize)
-__tokenizer_thread.start()
+# 字节到可见字符的映射，与 gpt2 的 merges.txt 使用的字符一致
+def bytes_to_unicode() -> Dict[int, str]:
+    bs = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + \
+        list(range(ord("®"), ord("ÿ") + 1))
+    cs = bs[:]
+    n = 0
+    for b in range(256):
+        if b not in bs:
+            bs.append(b)
+            cs.append(256 + n)
+            n += 1
+    return dict(zip(bs, map(chr, cs)))
+
+
+# 在 huggingface 缓存中查找 gpt2 的词表目录
+def find_gpt2_path() -> str:
+    hf_home = os.environ.get("HF_HOME", os.path.join(os.path.expanduser("~"), ".cache", "huggingface"))
+    for snapshot in sorted(glob.glob(os.path.join(hf_home, "hub", "models--gpt2", "snapshots", "*"))):
+        if os.path.isfile(os.path.join(snapshot, "merges.txt")):
+            return snapshot
+    raise error.InternalError("gpt2 merges.txt not found in huggingface cache")
+
+
+class TransformersBackend:
+    name = "transformers"
+
+    def __init__(self, config: TokenizerConfig):
+        os.environ['TRANSFORMERS_OFFLINE'] = '1'
+        from transformers import GPT2TokenizerFast
+        self.__tokenizer = GPT2TokenizerFast.from_pretrained(config.path or "gpt2")
+
+    def count(self, text: str) -> int:
+        return len(self.__tokenizer(text)['input_ids'])
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        return [len(input_ids) for input_ids in self.__tokenizer(texts)['input_ids']]
+
+
+# 不依赖 transformers 的字节级 BPE，只计数不需要 token id，所以只读取 merges.txt
+class BPEBackend:
+    name = "bpe"
+
+    def __init__(self, config: TokenizerConfig):
+        path = config.path or find_gpt2_path()
+        try:
+            with open(os.path.join(path, "merges.txt"), "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except OSError as e:
+            raise error.InternalError(f"invalid gpt2 merges.txt in {path}: {e}")
+        self.__ranks: Dict[Tuple[str, str], int] = {}
+        for line in lines:
+            if line.startswith("#version") or len(line.strip()) == 0:
+                continue
+            first, second = line.split()
+            self.__ranks[(first, second)] = len(self.__ranks)
+        self.__byte_encoder: Dict[int, str] = bytes_to_unicode()
+        self.__lock = threading.Lock()
+        self.__words: Dict[str, int] = {}
+
+    def count(self, text: str) -> int:
+        n = 0
+        for word in pattern.findall(text):
+            n += self.__bpe(''.join(self.__byte_encoder[b] for b in word.encode('utf-8')))
+        return n
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        return [self.count(text) for text in texts]
+
+    def __bpe(self, token: str) -> int:
+        with self.__lock:
+            n = self.__words.get(token)
+        if n is not None:
+            return n
+
+        word = list(token)
+        while len(word) > 1:
+            best = min(zip(word, word[1:]), key=lambda pair: self.__ranks.get(pair, math.inf))
+            if best not in self.__ranks:
+                break
+            new_word = []
+            i = 0
+            while i < len(word):
+                if i < len(word) - 1 and word[i] == best[0] and word[i + 1] == best[1]:
+                    new_word.append(best[0] + best[1])
+                    i += 2
+                else:
+                    new_word.append(word[i])
+                    i += 1
+            word = new_word
+
+        with self.__lock:
+            if len(self.__words) >= 65536:
+                self.__words.clear()
+            self.__words[token] = len(word)
+        return len(word)
+
+
+# 按字符类别估算 token 数，结果不会超过 UTF-8 字节数
+class EstimateBackend:
+    name = "estimate"
+
+    def __init__(self, config: TokenizerConfig):
+        self.__ascii_chars_per_token: float = config.ascii_chars_per_token
+        self.__non_ascii_tokens_per_byte: float = config.non_ascii_tokens_per_byte
+
+    def count(self, text: str) -> int:
+        n = 0
+        for word in pattern.findall(text):
+            size = len(word.encode('utf-8'))
+            if size == len(word):
+                estimate = math.ceil(size / self.__ascii_chars_per_token)
+            else:
+                estimate = math.ceil(size * self.__non_ascii_tokens_per_byte)
+            n += min(max(estimate, 1), size)
+        return n
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        return [self.count(text) for text in texts]
+
+
+backends = {
+    TransformersBackend.name: TransformersBackend,
+    BPEBackend.name: BPEBackend,
+    EstimateBackend.name: EstimateBackend,
+}
+
+
+# 以内容哈希为键的 token 数量缓存（LRU，线程安全）
+class TokenCache:
+    def __init__(self, capacity: int = 65536):
+        self.__lock = threading.Lock()
+        self.__capacity: int = capacity
+        self.__entries: OrderedDict[bytes, int] = OrderedDict()
+        self.__hits: int = 0
+        self.__misses: int = 0
+        self.__evictions: int = 0
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+    def get(self, key: bytes) -> int | None:
+        with self.__lock:
+            n = self.__entries.get(key)
+            if n is None:
+                self.__misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+            return n
+
+    def put(self, key: bytes, n: int):
+        with self.__lock:
+            self.__entries[key] = n
+            self.__entries.move_to_end(key)
+            self.__evict()
+
+    def resize(self, capacity: int):
+        with self.__lock:
+            self.__capacity = capacity
+            self.__evict()
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                "size": len(self.__entries),
+                "capacity": self.__capacity,
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "evictions": self.__evictions,
+            }
+
+    def __evict(self):
+        while len(self.__entries) > self.__capacity:
+            self.__entries.popitem(last=False)
+            self.__evictions += 1
+
+
+cache = TokenCache()
+
+backend: Any | None = None
+backend_name: str = ""
+backend_error: Exception | None = None
+__backend_thread: threading.Thread | None = None
+__backend_lock = threading.Lock()
+
+
+def __backend_initialize(config: TokenizerConfig):
+    global backend, backend_error
+    try:
+        backend = backends[config.backend](config)
+    except Exception as e:
+        backend_error = e
+
+
+def __backend_start(config: TokenizerConfig):
+    global backend, backend_name, backend_error, __backend_thread
+    if __backend_thread is not None:
+        __backend_thread.join()
+    backend = None
+    backend_name = config.backend
+    backend_error = None
+    cache.clear()
+    cache.resize(config.cache_size)
+    __backend_thread = threading.Thread(target=__backend_initialize, args=(config,))
+    __backend_thread.start()
+
+
+# 选择后端并在后台加载，启动时不必等待词表加载完成
+def initialize(config: TokenizerConfig = TokenizerConfig()):
+    if config.backend not in backends:
+        raise error.InvalidParamError(f"no such tokenizer backend: {config.backend}")
+    with __backend_lock:
+        __backend_start(config)
+
+
+def get_backend() -> Any:
+    if backend is not None:
+        return backend
+    with __backend_lock:
+        if __backend_thread is None:
+            # 没有显式初始化时使用默认后端
+            __backend_start(TokenizerConfig())
+    __backend_thread.join()
+    if backend is None:
+        raise error.InternalError(f"tokenizer backend {backend_name} failed to load: {backend_error}")
+    return backend
+
+
+def backend_info() -> dict:
+    return {
+        "name": backend_name,
+        "ready": backend is not None,
+        "error": "" if backend_error is None else str(backend_error),
+    }
+
+
+def cache_stats() -> dict:
+    return cache.stats()
 
 
 def token_len(text: str) -> int:
-    if tokenizer is None:
-        __tokenizer_thread.join()
-    return len(tokenizer(text)['input_ids'])
+    key = TokenCache.key(text)
+    n = cache.get(key)
+    if n is not None:
+        return n
+    n = get_backend().count(text)
+    cache.put(key, n)
+    return n
+
+
+# 判断 token 数是否不超过 limit
+# 字节级 BPE 的每个 token 至少对应一个字节，所以字节数不超过 limit 时可以直接得出结论，只有接近边界时才精确编码
+def token_len_at_most(text: str, limit: int) -> bool:
+    if len(text) * 4 <= limit:
+        return True
+    if len(text.encode('utf-8')) <= limit:
+        return True
+    return token_len(text) <= limit
+
+
+# 判断 token 数是否超过 limit
+def exceeds(text: str, limit: int) -> bool:
+    return not token_len_at_most(text, limit)
+
+
+# 批量计算 token 数，未命中缓存的文本去重后一次性编码
+def token_lens(texts: List[str]) -> List[int]:
+    keys = [TokenCache.key(text) for text in texts]
+    result: List[int | None] = [cache.get(key) for key in keys]
+
+    missing: OrderedDict[bytes, str] = OrderedDict()
+    for i in range(len(texts)):
+        if result[i] is None:
+            missing[keys[i]] = texts[i]
+    if len(missing) == 0:
+        return result
+
+    counts = {}
+    for key, n in zip(missing, get_backend().count_batch(list(missing.values()))):
+        counts[key] = n
+        cache.put(key, n)
+    for i in range(len(texts)):
+        if result[i] is None:
+            result[i] = counts[keys[i]]
+    return result
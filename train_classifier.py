@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- encoding:utf-8 -*-
+
+import argparse
+import os
+import sys
+
+
+# 从所有会话（包括归档）中收集由 ChatGPT 分类过的用户消息，按会话类型返回 (消息原文, 分类)
+def collect(database: str, config) -> dict:
+    from memory import Message
+    from session.classifier import parse_category
+    from session.database import open_database
+
+    db = open_database(database, config.storage)
+    samples = {}
+    for index in db.list():
+        storage = db.storage(index)
+        try:
+            conversations = storage.load_archives()
+            if storage.load(readonly=True):  # 不修复损坏的日志，训练不写入会话数据
+                conversations.append(storage.current)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"skip {index['id']}: {e}")
+            continue
+
+        seen = set()
+        for current in conversations:
+            for message in current.messages:
+                if message.sender != Message.USER or message.remark.get("classify_local", False):
+                    continue  # 本地分类的结果不能用来训练自己
+                raw = message.remark.get("raw", "")
+                category = parse_category(message.remark.get("classify", ""))
+                if len(raw) == 0 or len(category) == 0:
+                    continue
+                if len(message.mid) != 0:
+                    if message.mid in seen:
+                        continue
+                    seen.add(message.mid)
+                samples.setdefault(index["type"], []).append((raw, category))
+    return samples
+
+
+# 分类提示词相同的会话类型共用一个模型，返回模型名称与使用它的会话类型
+def group_types(text: str, types) -> dict:
+    import error
+    from memory import Message
+    from text import SessionText
+
+    groups = {}
+    for type_ in sorted(types):
+        try:
+            t = SessionText(os.path.join(text, type_))
+        except (OSError, error.ChatGPTSessionError) as e:
+            print(f"skip {type_}: {e}")
+            continue
+        prompt = t.classify_message(Message("", Message.USER, "", 0, {"raw": "x"}))
+        if len(prompt) == 0:
+            continue  # 该类型不需要分类
+        groups.setdefault(prompt, []).append(type_)
+    return {types_[0]: types_ for types_ in groups.values()}
+
+
+# 按归一化后的原文划分，相同的消息总是在同一边
+def held_out(raw: str, fraction: float) -> bool:
+    import hashlib
+    from session.classify import normalize
+
+    digest = hashlib.blake2b(normalize(raw).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64 < fraction
+
+
+def print_report(name: str, report: dict):
+    print(f"== {name}: {report['samples']} held-out samples, accuracy {report['accuracy']:.3f}, "
+          f"local coverage {report['coverage']:.3f}, local precision {report['precision']:.3f}")
+    print("category  support  predicted  precision  threshold  answered  answered_precision")
+    for category, c in report["categories"].items():
+        threshold = "-" if c["threshold"] is None else f"{c['threshold']:.4f}"
+        print(f"{category:>8}  {c['support']:>7}  {c['predicted']:>9}  {c['precision']:>9.3f}  {threshold:>9}  "
+              f"{c['answered']:>8}  {c['answered_precision']:>18.3f}")
+
+
+# 用留出的样本选择阈值并评估，然后用全部样本训练，阈值沿用留出样本上选出的
+def train(config_path: str, database: str, text: str, output: str, precision: float, min_support: int,
+          fraction: float, dry_run: bool) -> int:
+    import json
+
+    import tokenizer
+    from config import Config
+    from session.classifier import NaiveBayes, calibrate, evaluate
+
+    config = Config.from_file(config_path)
+    tokenizer.initialize(config.tokenizer)
+    samples = collect(database, config)
+    groups = group_types(text, samples.keys())
+
+    models = {}
+    types = {}
+    reports = {}
+    for name, types_ in groups.items():
+        group_samples = [sample for type_ in types_ for sample in samples[type_]]
+        train_samples = [sample for sample in group_samples if not held_out(sample[0], fraction)]
+        test_samples = [sample for sample in group_samples if held_out(sample[0], fraction)]
+        print(f"{name} ({', '.join(types_)}): {len(train_samples)} training samples, "
+              f"{len(test_samples)} held-out samples")
+        if len(train_samples) == 0 or len(test_samples) == 0:
+            print(f"skip {name}: not enough samples")
+            continue
+
+        model = NaiveBayes.train(train_samples)
+        model.thresholds = calibrate(model, test_samples, precision, min_support)
+        report = evaluate(model, test_samples)
+        print_report(name, report)
+
+        final = NaiveBayes.train(group_samples)
+        final.thresholds = model.thresholds
+        models[name] = final.to_dict()
+        reports[name] = report
+        for type_ in types_:
+            types[type_] = name
+
+    if dry_run:
+        return 0
+    with open(output, "w") as f:
+        f.write(json.dumps({"types": types, "models": models, "reports": reports}, ensure_ascii=False))
+    print(f"model saved to {output}, restart the server to load it")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="train the local classifier from stored classify results")
+    parser.add_argument('--config', '-c', type=str, help='config.json', default="config.json")
+    parser.add_argument('--database', '-d', type=str, help='database path', default='./database')
+    parser.add_argument('--text', '-t', type=str, help='text data path', default='./text')
+    parser.add_argument('--output', '-o', type=str, help='model file, default to classify.model_file in database')
+    parser.add_argument('--precision', type=float, help='required precision of local answers', default=0.95)
+    parser.add_argument('--min-support', type=int, help='minimum held-out answers per category', default=20)
+    parser.add_argument('--held-out', type=float, help='fraction of samples held out', default=0.2)
+    parser.add_argument('--eval', action='store_true', help='only print the evaluation, do not save the model')
+    args = parser.parse_args()
+
+    output = args.output
+    if output is None:
+        from config import Config
+        output = os.path.join(args.database, Config.from_file(args.config).classify.model_file)
+    return train(args.config, args.database, args.text, output, args.precision, args.min_support, args.held_out,
+                 args.eval)
+
+
+if __name__ == "__main__":
+    sys.exit(main())